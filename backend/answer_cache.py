@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+RABuddy Answer Cache
+Exact + semantic response cache with LRU/TTL eviction, tied to the index version
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 512))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv('ANSWER_CACHE_TTL_SECONDS', 6 * 60 * 60))
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', 0.93))
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(question.split())
+
+
+class AnswerCache:
+    """Two-layer cache: exact normalized text first, then cosine similarity of question embeddings"""
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+                 similarity_threshold: float = ANSWER_CACHE_SIMILARITY,
+                 enabled: bool = ANSWER_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.enabled = enabled
+        self.index_version = None
+        self._entries = OrderedDict()  # normalized question -> (embedding, result, stored_at)
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def set_index_version(self, index_version: str):
+        """Drop every entry when the document index changes"""
+        with self._lock:
+            if index_version != self.index_version:
+                if self._entries:
+                    self._stats["invalidations"] += 1
+                self._entries.clear()
+                self.index_version = index_version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - stored_at > self.ttl_seconds
+
+    def get_exact(self, key: str):
+        """Look up a normalized question; returns the cached result or None"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[2], time.monotonic()):
+                del self._entries[key]
+                self._stats["evictions"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["exact_hits"] += 1
+            return entry[1]
+
+    def get_similar(self, embedding):
+        """Find the most similar cached question above the threshold; counts a miss otherwise"""
+        if not self.enabled:
+            return None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        now = time.monotonic()
+
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if self._expired(entry[2], now)]:
+                del self._entries[key]
+                self._stats["evictions"] += 1
+
+            if self._entries:
+                keys = list(self._entries.keys())
+                matrix = np.stack([entry[0] for entry in self._entries.values()])
+                # Embeddings are L2-normalized, so the dot product is the cosine similarity
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    key = keys[best]
+                    self._entries.move_to_end(key)
+                    self._stats["semantic_hits"] += 1
+                    return self._entries[key][1]
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, embedding, result: dict):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._entries[key] = (np.asarray(embedding, dtype=np.float32), result, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["exact_hits"] + self._stats["semantic_hits"] + self._stats["misses"]
+            hits = self._stats["exact_hits"] + self._stats["semantic_hits"]
+            return {
+                **self._stats,
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "index_version": self.index_version
+            }
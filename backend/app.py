@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 """
 RABuddy Backend Entry Point - Enhanced with better PDF processing
+Development server; production runs gunicorn with wsgi.py (see start_backend.sh)
 """
 
-from enhanced_app import app
+from enhanced_app import app, start_background_warmup
 
 if __name__ == '__main__':
     import os
     port = int(os.environ.get('PORT', 5001))
+
+    # Bind right away; components warm up in the background (see /api/ready)
+    start_background_warmup()
+
     print(f"🚀 RABuddy Enhanced Backend starting on port {port}")
-    app.run(host='0.0.0.0', port=port, debug=True)
+    # The reloader would warm up (and ingest) a second time in its child process
+    app.run(host='0.0.0.0', port=port, debug=True, use_reloader=False)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+RABuddy Batch Query CLI
+Runs a list of questions through /api/query/batch (or in-process with --local) and writes JSON Lines,
+e.g. to pre-warm the answer cache before training week or to review answers after a document update.
+
+Usage:
+    python batch_query.py faq.txt --output answers.jsonl
+    python batch_query.py benchmark_questions.json --url http://localhost:5001 --extractive
+    python batch_query.py faq.txt --local --workers 8
+"""
+
+import argparse
+import json
+import sys
+import time
+import urllib.request
+from collections import Counter
+from pathlib import Path
+
+
+def load_questions(path: Path) -> list:
+    """Questions from a JSON list (strings or {"question": ...} objects), JSON Lines, or one per line"""
+    text = path.read_text()
+    if path.suffix == ".json":
+        items = json.loads(text)
+    elif path.suffix == ".jsonl":
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        items = text.splitlines()
+    questions = [item["question"] if isinstance(item, dict) else item for item in items]
+    return [question.strip() for question in questions if question and question.strip()]
+
+
+def remote_results(url: str, payload: dict, timeout: float):
+    """Stream result objects from a running server's batch endpoint"""
+    request = urllib.request.Request(
+        url.rstrip("/") + "/api/query/batch",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json", "Accept": "application/x-ndjson"}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        for line in response:
+            if line.strip():
+                yield json.loads(line)
+
+
+def local_results(rag, payload: dict, workers: int):
+    """Answer the batch in this process"""
+    questions = payload["questions"]
+    for i, result in rag.batch_query(questions, payload.get("extractive"), payload.get("debug", False), workers):
+        yield {"index": i, "question": questions[i], **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a list of questions through RABuddy and write JSON Lines")
+    parser.add_argument("questions", type=Path, help=".json, .jsonl or plain-text file (one question per line)")
+    parser.add_argument("--url", default="http://localhost:5001", help="Server to send the batch to")
+    parser.add_argument("--local", action="store_true", help="Answer in this process instead of calling a server")
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent generations (--local only; server uses BATCH_GENERATION_WORKERS)")
+    parser.add_argument("--batch-size", type=int, default=200, help="Questions per request")
+    parser.add_argument("--extractive", action="store_true", default=None, help="Allow extractive (no-LLM) answers")
+    parser.add_argument("--debug", action="store_true", help="Include per-stage timings_ms in each result")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait on each batch request")
+    parser.add_argument("--output", type=Path, help="JSON Lines file to write (default: stdout)")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    if not questions:
+        sys.exit(f"No questions in {args.questions}")
+
+    rag = None
+    if args.local:
+        import enhanced_app as rag  # loads the embedding model, index and Gemini in this process
+
+        if not rag.initialize_enhanced_rag():
+            sys.exit("RABuddy failed to initialize, see the log above")
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    methods = Counter()
+    started = time.perf_counter()
+    try:
+        for offset in range(0, len(questions), args.batch_size):
+            payload = {"questions": questions[offset:offset + args.batch_size], "debug": args.debug}
+            if args.extractive is not None:
+                payload["extractive"] = args.extractive
+
+            if rag is not None:
+                results = local_results(rag, payload, args.workers or rag.BATCH_GENERATION_WORKERS)
+            else:
+                results = remote_results(args.url, payload, args.timeout)
+
+            for result in results:
+                if "index" in result:
+                    result["index"] += offset
+                methods[result.get("method", "error")] += 1
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+    finally:
+        if args.output:
+            output.close()
+
+    seconds = time.perf_counter() - started
+    summary = ", ".join(f"{method}: {count}" for method, count in methods.most_common())
+    print(f"✅ {sum(methods.values())}/{len(questions)} answers in {seconds:.1f}s ({summary})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+RABuddy Offline Benchmark
+Measures ingest throughput, retrieval latency, end-to-end /api/query latency and peak RSS
+using a stub LLM, and emits the results as JSON so runs can be compared across commits.
+
+Usage:
+    python benchmark.py --clients 8 --rounds 3 --output bench.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+QUESTIONS_FILE = Path(__file__).parent / "benchmark_questions.json"
+
+
+def percentiles(samples: list) -> dict:
+    """p50/p95/p99 summary in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 2),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+        "max_ms": round(float(values.max()), 2)
+    }
+
+
+def peak_rss_mb() -> dict:
+    """Peak resident set size of this process and of its (ingest worker) children"""
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # bytes on macOS, KB on Linux
+    return {
+        "self_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1)
+    }
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_questions(path: Path) -> list:
+    with open(path) as f:
+        return json.load(f)
+
+
+def bench_ingest(rag) -> dict:
+    """Full rebuild, then a no-change re-sync (manifest hit path)"""
+    from chunking import histogram_buckets
+    from ingest_pipeline import count_pages
+    from manifest import load_manifest, manifest_chunk_histogram
+
+    pdf_paths = sorted(rag.PDFS_DIR.glob("*.pdf"))
+    pages = sum(count_pages(path) for path in pdf_paths)
+
+    started = time.perf_counter()
+    ok, chunks = rag.process_pdfs_enhanced(force=True)
+    rebuild_seconds = time.perf_counter() - started
+    if not ok:
+        raise RuntimeError("process_pdfs_enhanced(force=True) failed")
+
+    started = time.perf_counter()
+    rag.process_pdfs_enhanced()
+    resync_seconds = time.perf_counter() - started
+
+    return {
+        "pdfs": len(pdf_paths),
+        "pages": pages,
+        "chunks": chunks,
+        "rebuild_seconds": round(rebuild_seconds, 3),
+        "pages_per_second": round(pages / rebuild_seconds, 2),
+        "chunks_per_second": round(chunks / rebuild_seconds, 2),
+        "resync_seconds": round(resync_seconds, 3),
+        "chunking": rag.CHUNKING_PARAMS,
+        "chunk_length_histogram": histogram_buckets(manifest_chunk_histogram(load_manifest(rag.active_index_dir(), rag.ingest_params())))
+    }
+
+
+def bench_retrieval(rag, questions: list, rounds: int) -> dict:
+    """Query embedding and hybrid search latency, plus how often the expected PDF is retrieved"""
+    embed_times, search_times, total_times = [], [], []
+    hits = 0
+    answerable = [item for item in questions if item["expected_source"]]
+
+    for round_number in range(rounds):
+        for item in questions:
+            started = time.perf_counter()
+            query_embedding = rag.embedding_engine.encode_query(item["question"])
+            embedded = time.perf_counter()
+            docs, _ = rag.retrieve_relevant_docs(item["question"], query_embedding)
+            finished = time.perf_counter()
+
+            embed_times.append(embedded - started)
+            search_times.append(finished - embedded)
+            total_times.append(finished - started)
+            if round_number == 0 and item["expected_source"] and any(doc["metadata"].get("source") == item["expected_source"] for doc in docs):
+                hits += 1
+
+    return {
+        "embed": percentiles(embed_times),
+        "search": percentiles(search_times),
+        "total": percentiles(total_times),
+        "expected_source_recall": round(hits / len(answerable), 3) if answerable else None
+    }
+
+
+def bench_extractive(rag, questions: list, thresholds: list) -> dict:
+    """How many questions the no-LLM fast path would answer at each score threshold, and how accurately"""
+    from context_builder import build_context
+    from extractive import EXTRACTIVE_MIN_MARGIN, extractive_answer
+
+    contexts = []
+    for item in questions:
+        docs, _ = rag.retrieve_relevant_docs(item["question"], rag.embedding_engine.encode_query(item["question"]))
+        contexts.append((item, build_context(item["question"], docs)[0]))
+
+    sweep = []
+    for min_score in thresholds:
+        answered = {}
+        correct = 0
+        for item, docs in contexts:
+            answer, _ = extractive_answer(item["question"], docs, min_score=min_score)
+            if answer is not None:
+                answered[item["kind"]] = answered.get(item["kind"], 0) + 1
+                correct += docs[0]["metadata"].get("source") == item["expected_source"]
+        total_answered = sum(answered.values())
+        sweep.append({
+            "min_score": min_score,
+            "answered": total_answered,
+            "answered_by_kind": answered,
+            "coverage": round(total_answered / len(contexts), 3) if contexts else None,
+            "expected_source_precision": round(correct / total_answered, 3) if total_answered else None
+        })
+
+    return {
+        "min_margin": EXTRACTIVE_MIN_MARGIN,
+        "questions_by_kind": {kind: sum(item["kind"] == kind for item in questions) for kind in sorted({item["kind"] for item in questions})},
+        "sweep": sweep
+    }
+
+
+def embedding_worker(backend: str, questions: list) -> dict:
+    """Runs in a fresh process so import time and RSS belong to one backend only"""
+    started = time.perf_counter()
+    if backend == "onnx":
+        import onnxruntime  # noqa: F401
+        import tokenizers  # noqa: F401
+    else:
+        import sentence_transformers  # noqa: F401
+    import_seconds = time.perf_counter() - started
+
+    from embeddings import create_embedding_engine
+
+    engine = create_embedding_engine(backend)
+    started = time.perf_counter()
+    engine.load()
+    load_seconds = time.perf_counter() - started
+
+    texts = [item["question"] for item in questions]
+    engine.encode_query(texts[0])  # warm-up
+
+    latencies = []
+    for text in texts * 5:
+        started = time.perf_counter()
+        engine.encode_query(text)
+        latencies.append(time.perf_counter() - started)
+
+    batch = texts * 16
+    started = time.perf_counter()
+    engine.encode(batch)
+    batch_seconds = time.perf_counter() - started
+
+    return {
+        "backend": backend,
+        "space_id": engine.space_id,
+        "import_seconds": round(import_seconds, 3),
+        "load_seconds": round(load_seconds, 3),
+        "query_encode": percentiles(latencies),
+        "batch_texts_per_second": round(len(batch) / batch_seconds, 1),
+        "rss_mb": current_rss_mb(),
+        "peak_rss_mb": peak_rss_mb()["self_mb"],
+        "vectors": engine.encode(texts)
+    }
+
+
+def bench_embedding_backends(backends: list, questions_path: Path) -> dict:
+    """Compare backends, each in its own process, and check their vectors agree with the first one"""
+    runs = []
+    for backend in backends:
+        completed = subprocess.run(
+            [sys.executable, __file__, "--embedding-worker", backend, "--questions", str(questions_path)],
+            capture_output=True, text=True, cwd=Path(__file__).parent
+        )
+        if completed.returncode != 0:
+            runs.append({"backend": backend, "error": completed.stderr.strip().splitlines()[-1:]})
+            continue
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    baseline = next((run for run in runs if "vectors" in run), None)
+    if baseline is not None:
+        baseline_vectors = np.asarray(baseline["vectors"], dtype=np.float32)  # the loop pops "vectors" from every run
+    for run in runs:
+        vectors = run.pop("vectors", None)
+        if vectors is None or baseline is None:
+            continue
+        a, b = baseline_vectors, np.asarray(vectors, dtype=np.float32)
+        if a.shape != b.shape:
+            run["agreement_with_" + baseline["backend"]] = "different dimensions"
+            continue
+        cosine = (a * b).sum(axis=1) / np.maximum(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12)
+        run["agreement_with_" + baseline["backend"]] = {
+            "min_cosine": round(float(cosine.min()), 6),
+            "mean_cosine": round(float(cosine.mean()), 6)
+        }
+    return {"backends": runs}
+
+
+def bench_end_to_end(rag, questions: list, clients: int, requests_per_client: int, extractive: bool = False) -> dict:
+    """N concurrent clients posting to /api/query through the Flask test client"""
+    stage_samples = {}
+
+    def client_loop(client_number: int) -> list:
+        client = rag.app.test_client()
+        results = []
+        for i in range(requests_per_client):
+            item = questions[(client_number * requests_per_client + i) % len(questions)]
+            started = time.perf_counter()
+            response = client.post('/api/query', json={"question": item["question"], "debug": True, "extractive": extractive})
+            body = response.get_json(silent=True) or {}
+            results.append((time.perf_counter() - started, response.status_code, body.get("method")))
+            if response.status_code == 200:
+                timings = body.get("processing_info", {}).get("timings_ms", {})
+                for stage, ms in timings.items():
+                    stage_samples.setdefault(stage, []).append(ms / 1000)
+        return results
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        samples = [sample for results in pool.map(client_loop, range(clients)) for sample in results]
+    wall_seconds = time.perf_counter() - started
+
+    status_codes = {}
+    methods = {}
+    for _, status, method in samples:
+        status_codes[str(status)] = status_codes.get(str(status), 0) + 1
+        if method:
+            methods[method] = methods.get(method, 0) + 1
+    succeeded = [latency for latency, status, _ in samples if status == 200]
+
+    return {
+        "clients": clients,
+        "requests": len(samples),
+        "status_codes": status_codes,
+        "methods": methods,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(succeeded) / wall_seconds, 2),
+        "latency": percentiles(succeeded),
+        "stages": {stage: percentiles(samples) for stage, samples in sorted(stage_samples.items())}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline RABuddy benchmark (no network, stub LLM)")
+    parser.add_argument("--questions", type=Path, default=QUESTIONS_FILE)
+    parser.add_argument("--pdfs", type=Path, help="PDF directory (default: the repo's pdfs/)")
+    parser.add_argument("--store", type=Path, help="Index directory (default: a fresh temp dir)")
+    parser.add_argument("--rounds", type=int, default=3, help="Passes over the question set for retrieval timing")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent /api/query clients")
+    parser.add_argument("--requests-per-client", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.6, help="Stub time to first token (s)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--with-cache", action="store_true", help="Keep the answer cache on for end-to-end runs")
+    parser.add_argument("--extractive", action="store_true", help="Enable the no-LLM extractive fast path for end-to-end runs")
+    parser.add_argument("--extractive-thresholds", type=float, nargs="+", default=[0.4, 0.5, 0.55, 0.6, 0.7],
+                        help="EXTRACTIVE_MIN_SCORE values to sweep")
+    parser.add_argument("--compare-embeddings", nargs="+", metavar="BACKEND",
+                        help="Only compare embedding backends (e.g. sentence-transformers onnx)")
+    parser.add_argument("--embedding-worker", help=argparse.SUPPRESS)
+    parser.add_argument("--output", type=Path, help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    if args.embedding_worker:
+        print(json.dumps(embedding_worker(args.embedding_worker, load_questions(args.questions))))
+        return
+
+    logging.basicConfig(level=logging.WARNING)
+
+    # enhanced_app reads its storage paths at import time
+    store = args.store or Path(tempfile.mkdtemp(prefix="rabuddy-bench-"))
+    os.environ["CHROMA_STORE_PATH"] = str(store)
+    # Synthetic questions must not end up in the real feedback log or session store
+    scratch = Path(tempfile.mkdtemp(prefix="rabuddy-bench-data-"))
+    os.environ["FEEDBACK_LOG_PATH"] = str(scratch / "feedback.jsonl")
+    os.environ["SESSION_STORE_PATH"] = str(scratch / "sessions")
+    if args.pdfs:
+        os.environ["PDFS_DIR"] = str(args.pdfs)
+
+    import enhanced_app as rag
+    from stub_llm import StubGenerativeModel
+
+    logging.getLogger().setLevel(logging.WARNING)
+    questions = load_questions(args.questions)
+    config = {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items() if k not in ("output", "embedding_worker")}
+    config["store"] = str(store)
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": config
+    }
+
+    if args.compare_embeddings:
+        results["embeddings"] = bench_embedding_backends(args.compare_embeddings, args.questions)
+        write_report(results, args.output)
+        return
+
+    started = time.perf_counter()
+    if not rag.warmup.run("embeddings", rag.setup_enhanced_embedding):
+        sys.exit("Embedding model failed to load")
+    results["embedding_load_seconds"] = round(time.perf_counter() - started, 3)
+    results["embedding_space"] = rag.embedding_engine.space_id
+
+    results["ingest"] = bench_ingest(rag)
+    rag.warmup.run("index", lambda: True)
+    if not rag.warmup.run("chromadb", rag.connect_chromadb):
+        sys.exit("Could not open the benchmark collection")
+
+    results["retrieval"] = bench_retrieval(rag, questions, args.rounds)
+    results["extractive"] = bench_extractive(rag, questions, args.extractive_thresholds)
+
+    stub = StubGenerativeModel(first_token_latency=args.llm_latency, tokens_per_second=args.llm_tokens_per_second)
+    rag.gemini_model = stub
+    rag.warmup.run("gemini", lambda: True)
+    rag.answer_cache.enabled = args.with_cache
+
+    results["end_to_end"] = bench_end_to_end(rag, questions, args.clients, args.requests_per_client, args.extractive)
+    results["end_to_end"]["llm_calls"] = stub.calls
+    results["end_to_end"]["answer_cache"] = rag.answer_cache.stats()
+    results["end_to_end"]["coalescing"] = rag.inflight_queries.stats()
+    results["peak_rss"] = peak_rss_mb()
+
+    write_report(results, args.output)
+
+
+def write_report(results: dict, output: Path = None):
+    report = json.dumps(results, indent=2)
+    if output:
+        output.write_text(report + "\n")
+        print(f"📊 Benchmark results written to {output}")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
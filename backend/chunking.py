@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+RABuddy Chunking
+Pluggable page chunkers returning character spans; the structured chunker keeps headings and list items intact
+"""
+
+import re
+
+from context_builder import estimate_tokens
+
+LIST_ITEM_PATTERN = re.compile(r"^\s*(?:[•●▪◦‣\-*]|\d{1,2}[.)]|[a-zA-Z][.)]|\(?[ivx]{1,4}\))\s+")
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s+")
+WHITESPACE_PATTERN = re.compile(r"[ \t\r\f\v]+")
+
+# Upper edges (characters) of the chunk-length histogram written at ingest
+CHUNK_LENGTH_BINS = (100, 200, 400, 600, 800, 1000, 1500, 2000)
+
+
+def is_heading(line: str) -> bool:
+    """Short, mostly upper-case lines such as "PROCEDURE" or "24 LOCKOUTS BY UH STAFF\""""
+    line = line.strip()
+    if not line or len(line) > 80 or line.endswith(('.', ',', ';')):
+        return False
+    letters = [c for c in line if c.isalpha()]
+    return len(letters) >= 3 and sum(c.isupper() for c in letters) >= 0.8 * len(letters)
+
+
+def clean_chunk_text(text: str) -> str:
+    """Collapse runs of spaces and blank lines while keeping line structure"""
+    lines = (WHITESPACE_PATTERN.sub(" ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def chunk_sentences(text: str, params: dict) -> list:
+    """Original chunker: groups of sentences_per_chunk sentences split on '. '"""
+    spans = []
+    flat = text.replace('\n', ' ')  # same length, so positions map straight back to the page text
+    sentences = flat.split('. ')
+    starts = []
+    position = 0
+    for sentence in sentences:
+        starts.append(position)
+        position += len(sentence) + 2
+
+    size = params["sentences_per_chunk"]
+    for i in range(0, len(sentences), size):
+        group = sentences[i:i + size]
+        raw = '. '.join(group)
+        chunk_text = raw.strip()
+        if len(chunk_text) > params["min_chunk_chars"]:
+            start = starts[i] + (len(raw) - len(raw.lstrip()))
+            spans.append((start, start + len(chunk_text), chunk_text, None))
+    return spans
+
+
+def _blocks(text: str) -> list:
+    """Group lines into (start, end, kind) blocks: headings, list items and paragraphs
+
+    PDF extraction wraps lines mid-sentence, so consecutive plain lines join the
+    paragraph or list item above them; blank lines end a block.
+    """
+    blocks = []
+    position = 0
+    current = None
+    for line in text.splitlines(keepends=True):
+        start, end = position, position + len(line.rstrip('\r\n'))
+        position += len(line)
+
+        if not line.strip():
+            current = None
+            continue
+        if is_heading(line):
+            blocks.append([start, end, "heading"])
+            current = None
+        elif LIST_ITEM_PATTERN.match(line) or current is None:
+            current = [start, end, "item" if LIST_ITEM_PATTERN.match(line) else "paragraph"]
+            blocks.append(current)
+        else:
+            current[1] = end
+    return [tuple(block) for block in blocks]
+
+
+def _split_long(text: str, start: int, end: int, limit: int, piece: int, length) -> list:
+    """Break a block longer than the window into sentences, and over-long sentences at spaces
+
+    Run-on text is cut into pieces of at most piece units so overlap still has
+    something small enough to carry into the next chunk.
+    """
+    units = []
+    boundaries = [start + m.end() for m in SENTENCE_END_PATTERN.finditer(text[start:end])] + [end]
+    previous = start
+    for boundary in boundaries:
+        if boundary <= previous:
+            continue
+        if length(text[previous:boundary]) <= limit:
+            units.append((previous, boundary))
+            previous = boundary
+            continue
+        while previous < boundary and length(text[previous:boundary]) > piece:
+            window = _fitting_chars(text, previous, boundary, piece, length)
+            cut = text.rfind(" ", previous + 1, previous + window)
+            cut = cut if cut > previous else previous + window
+            units.append((previous, cut))
+            previous = cut
+        if previous < boundary:
+            units.append((previous, boundary))
+        previous = boundary
+    return units
+
+
+def _fitting_chars(text: str, start: int, end: int, limit: int, length) -> int:
+    """Longest prefix of text[start:end] (in characters) that fits in limit units"""
+    low, high = 1, end - start
+    while low < high:
+        middle = (low + high + 1) // 2
+        if length(text[start:start + middle]) <= limit:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def chunk_structured(text: str, params: dict) -> list:
+    """Pack heading / list item / paragraph blocks into windows of chunk_size with chunk_overlap
+
+    Sizes are in characters or estimated tokens (chunk_unit). A heading starts a
+    new chunk once the current one is a quarter full and never ends one, so
+    sections and numbered steps stay together; chunks only overlap within a section.
+    Returns (start, end, text, section) spans of the page text.
+    """
+    length = estimate_tokens if params.get("chunk_unit") == "tokens" else len
+    size = max(1, params["chunk_size"])
+    overlap = max(0, min(params["chunk_overlap"], size // 2))
+    piece = max(1, min(overlap, size // 4) if overlap else size // 4)
+
+    units = []  # (start, end, is_heading)
+    for start, end, kind in _blocks(text):
+        if length(text[start:end]) <= size:
+            units.append((start, end, kind == "heading"))
+        else:
+            units.extend((s, e, False) for s, e in _split_long(text, start, end, size, piece, length))
+    sizes = [length(text[s:e]) for s, e, _ in units]
+
+    spans = []
+    section = None
+    i = 0
+    while i < len(units):
+        j = i
+        used = 0
+        while j < len(units):
+            if j > i and units[j][2] and used >= size // 4:
+                break
+            if j > i and used + sizes[j] > size:
+                break
+            used += sizes[j] + 1
+            j += 1
+        while j - 1 > i and units[j - 1][2]:
+            j -= 1  # don't end a chunk on its next section's heading
+
+        for start, end, heading in units[i:j]:
+            if heading:
+                section = clean_chunk_text(text[start:end])
+                break
+        chunk_text = clean_chunk_text(text[units[i][0]:units[j - 1][1]])
+        if len(chunk_text) > params["min_chunk_chars"]:
+            spans.append((units[i][0], units[j - 1][1], chunk_text, section))
+        if j >= len(units):
+            break
+
+        # Carry trailing units into the next chunk, unless it starts a new section
+        k = j
+        if not units[j][2]:
+            carried = 0
+            while k - 1 > i and not units[k - 1][2] and carried + sizes[k - 1] <= overlap:
+                k -= 1
+                carried += sizes[k]
+        i = k
+
+        for start, end, heading in reversed(units[:i]):
+            if heading:
+                section = clean_chunk_text(text[start:end])
+                break
+    return spans
+
+
+CHUNKERS = {
+    "sentences": chunk_sentences,
+    "structured": chunk_structured
+}
+
+
+def chunk_text_spans(text: str, params: dict) -> list:
+    """Run the configured chunker on one page's text"""
+    chunker = CHUNKERS.get(params["strategy"])
+    if chunker is None:
+        raise ValueError(f"Unknown chunking strategy {params['strategy']!r}, expected one of {sorted(CHUNKERS)}")
+    return chunker(text, params)
+
+
+def length_histogram(lengths: list) -> list:
+    """Chunk counts per CHUNK_LENGTH_BINS bucket (the last bucket is everything longer)"""
+    counts = [0] * (len(CHUNK_LENGTH_BINS) + 1)
+    for value in lengths:
+        for i, edge in enumerate(CHUNK_LENGTH_BINS):
+            if value <= edge:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    return counts
+
+
+def histogram_buckets(counts: list) -> dict:
+    """Label length_histogram counts by bucket, e.g. {"<=800": 12, ">2000": 0}"""
+    labels = [f"<={edge}" for edge in CHUNK_LENGTH_BINS] + [f">{CHUNK_LENGTH_BINS[-1]}"]
+    return dict(zip(labels, counts))
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+RABuddy Concurrency Controls
+Admission control for incoming queries, a bounded gate around Gemini calls and single-flight coalescing
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Each query holds a gunicorn thread from start to finish (gthread workers are WSGI, nothing is awaited), so
+# admission is sized from the worker's threads, keeping a few free to answer 429s and health checks
+WORKER_THREADS = int(os.getenv('GUNICORN_THREADS', 8))
+RESERVED_THREADS = int(os.getenv('RESERVED_THREADS', 2))
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', max(1, WORKER_THREADS - RESERVED_THREADS)))
+MAX_QUEUED_REQUESTS = int(os.getenv('MAX_QUEUED_REQUESTS', 0))  # a queued request holds a thread too
+QUEUE_TIMEOUT_SECONDS = float(os.getenv('QUEUE_TIMEOUT_SECONDS', 10))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+LLM_ACQUIRE_TIMEOUT_SECONDS = float(os.getenv('LLM_ACQUIRE_TIMEOUT_SECONDS', 20))
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', 30))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('REQUEST_TIMEOUT_SECONDS', 45))
+COALESCE_QUERIES = os.getenv('COALESCE_QUERIES', 'true').lower() == 'true'
+
+
+class Overloaded(Exception):
+    """Raised when a request can't be admitted; maps to HTTP 429"""
+
+    def __init__(self, message: str, retry_after: int = 2):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionControl:
+    """Caps in-flight requests and the number allowed to wait for a slot
+
+    Requests beyond max_in_flight wait up to queue_timeout seconds; once
+    max_queued are already waiting, new requests are rejected immediately.
+    Limits are per worker process. A waiting request occupies a server
+    thread, so max_in_flight + max_queued must stay below the worker's
+    threads; otherwise excess requests queue inside gunicorn, where no 429
+    can be sent.
+    """
+
+    def __init__(self, max_in_flight: int = MAX_CONCURRENT_REQUESTS,
+                 max_queued: int = MAX_QUEUED_REQUESTS,
+                 queue_timeout: float = QUEUE_TIMEOUT_SECONDS):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._admitted = 0
+        self._rejected = 0
+
+    def acquire(self):
+        with self._condition:
+            if self._in_flight >= self.max_in_flight:
+                if self._waiting >= self.max_queued:
+                    self._rejected += 1
+                    raise Overloaded("Server is busy, please retry shortly")
+
+                self._waiting += 1
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while self._in_flight >= self.max_in_flight:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._rejected += 1
+                            raise Overloaded("Timed out waiting in the request queue")
+                        self._condition.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            self._in_flight += 1
+            self._admitted += 1
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def admit(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "in_flight": self._in_flight,
+                "queued": self._waiting,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "max_in_flight": self.max_in_flight,
+                "max_queued": self.max_queued
+            }
+
+
+class LLMGate:
+    """Bounds concurrent Gemini calls so bursts queue here instead of at the API"""
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 acquire_timeout: float = LLM_ACQUIRE_TIMEOUT_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.acquire_timeout = acquire_timeout
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._timeouts = 0
+
+    def _enter(self):
+        with self._lock:
+            self._in_flight += 1
+
+    def _exit(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._semaphore.release()
+
+    def _reject(self):
+        with self._lock:
+            self._timeouts += 1
+        raise Overloaded("All LLM slots are busy, please retry shortly")
+
+    @contextmanager
+    def slot(self):
+        if not self._semaphore.acquire(timeout=self.acquire_timeout):
+            self._reject()
+        self._enter()
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "max_concurrency": self.max_concurrency,
+                "acquire_timeouts": self._timeouts
+            }
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs one computation per key at a time; concurrent callers with the same key share its outcome
+
+    Thread-based rather than asyncio-based because Flask gives each async
+    request its own event loop, so futures can't be awaited across requests.
+    """
+
+    def __init__(self, enabled: bool = COALESCE_QUERIES, wait_timeout: float = REQUEST_TIMEOUT_SECONDS):
+        self.enabled = enabled
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._leaders = 0
+        self._coalesced = 0
+        self._wait_timeouts = 0
+
+    def do(self, key, fn) -> tuple:
+        """Return (result, shared); shared is True when another caller's computation was reused
+
+        Exceptions raised by the leader's fn are re-raised in every waiting caller.
+        Waiters give up with TimeoutError after wait_timeout seconds, so a hung
+        leader can't hold them forever.
+        """
+        if not self.enabled:
+            return fn(), False
+
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self._leaders += 1
+                leader = True
+            else:
+                flight.waiters += 1
+                self._coalesced += 1
+                leader = False
+
+        if not leader:
+            finished = flight.done.wait(self.wait_timeout)
+            with self._lock:
+                flight.waiters -= 1
+                if not finished:
+                    self._wait_timeouts += 1
+            if not finished:
+                raise TimeoutError(f"Identical query still running after {self.wait_timeout:g}s")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "in_flight_keys": len(self._flights),
+                "waiting": sum(flight.waiters for flight in self._flights.values()),
+                "leaders": self._leaders,
+                "coalesced": self._coalesced,
+                "wait_timeouts": self._wait_timeouts
+            }
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+RABuddy Context Builder
+Packs retrieved chunks into a token budget: dedupe near-duplicates, keep the most relevant sentences
+"""
+
+import os
+import re
+
+from lexical_index import tokenize
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 1200))
+CHUNK_TOKEN_LIMIT = int(os.getenv('CHUNK_TOKEN_LIMIT', 300))
+CONTEXT_DEDUP_SIMILARITY = float(os.getenv('CONTEXT_DEDUP_SIMILARITY', 0.8))
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?;:])\s+|\s*\n+\s*")
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate Gemini token count (~4 characters per token for English)"""
+    return (len(text) + 3) // 4
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """Word n-grams used to spot chunks that say the same thing"""
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def overlap(a: set, b: set) -> float:
+    """Share of the smaller chunk's shingles found in the other (catches contained chunks too)"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def select_sentences(question: str, text: str, token_limit: int) -> str:
+    """Keep the sentences sharing the most terms with the question, in document order"""
+    if estimate_tokens(text) <= token_limit:
+        return text
+
+    sentences = [s for s in SENTENCE_PATTERN.split(text) if s.strip()]
+    query_terms = set(tokenize(question))
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (-len(query_terms & set(tokenize(sentences[i]))), i)
+    )
+
+    keep = set()
+    used = 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i]) + 1
+        if used + cost > token_limit:
+            if not keep:
+                # A single oversized sentence: hard-truncate rather than drop the chunk
+                return sentences[i][:token_limit * 4].rstrip() + "…"
+            continue
+        keep.add(i)
+        used += cost
+
+    return " ".join(sentences[i] for i in sorted(keep))
+
+
+def build_context(question: str, docs: list, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                  chunk_token_limit: int = CHUNK_TOKEN_LIMIT,
+                  dedup_similarity: float = CONTEXT_DEDUP_SIMILARITY) -> tuple:
+    """Choose which retrieved chunks go into the prompt
+
+    Docs are taken in rank order. Near-duplicates of an already chosen chunk
+    (e.g. the same assembly area in both evacuation PDFs) are skipped, long
+    chunks are cut down to their most query-relevant sentences, and packing
+    stops at the token budget. Chosen docs get a "context" field with the
+    text to send and are renumbered so citations stay contiguous.
+    Returns (selected_docs, stats).
+    """
+    selected = []
+    seen_shingles = []
+    used_tokens = 0
+    stats = {"chunks_considered": len(docs), "duplicates_dropped": 0, "chunks_truncated": 0, "chunks_over_budget": 0}
+
+    for doc in docs:
+        doc_shingles = shingles(doc["content"])
+        if any(overlap(doc_shingles, other) >= dedup_similarity for other in seen_shingles):
+            stats["duplicates_dropped"] += 1
+            continue
+
+        remaining = token_budget - used_tokens
+        if remaining <= 0:
+            stats["chunks_over_budget"] += 1
+            continue
+
+        context = select_sentences(question, doc["content"], min(chunk_token_limit, remaining))
+        if context != doc["content"]:
+            stats["chunks_truncated"] += 1
+
+        seen_shingles.append(doc_shingles)
+        used_tokens += estimate_tokens(context)
+        selected.append({**doc, "context": context, "source_number": len(selected) + 1})
+
+    stats["chunks_used"] = len(selected)
+    stats["context_tokens"] = used_tokens
+    return selected, stats
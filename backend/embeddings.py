@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+RABuddy Embedding Engine
+One embedding model shared by ingestion and queries, encoding in large batches.
+Backends: SentenceTransformer (torch) or the same model exported to ONNX (onnxruntime, no torch).
+"""
+
+import logging
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'sentence-transformers')  # or "onnx"
+EMBEDDING_MODEL_NAME = os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 128))
+EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS', 0))  # 0 = library default
+
+# ONNX backend: a local export directory, or the exports published in the model's Hugging Face repo
+EMBEDDING_ONNX_DIR = os.getenv('EMBEDDING_ONNX_DIR', '')
+EMBEDDING_ONNX_FILE = os.getenv('EMBEDDING_ONNX_FILE', 'onnx/model.onnx')  # e.g. onnx/model_quint8_avx2.onnx
+EMBEDDING_MAX_SEQ_LENGTH = int(os.getenv('EMBEDDING_MAX_SEQ_LENGTH', 256))  # all-MiniLM-L6-v2's limit
+
+# A fixed sentence embedded at ingest; a backend whose vector for it differs forces a re-index
+EMBEDDING_PROBE_TEXT = "Where do residents assemble during a fire alarm evacuation?"
+EMBEDDING_PROBE_MIN_SIMILARITY = float(os.getenv('EMBEDDING_PROBE_MIN_SIMILARITY', 0.999))
+
+
+class EmbeddingEngine:
+    """Wraps the embedding model so every caller shares one copy and one vector space"""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME,
+                 batch_size: int = EMBEDDING_BATCH_SIZE,
+                 num_threads: int = EMBEDDING_THREADS):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.model = None
+        self._lock = threading.Lock()
+
+    @property
+    def space_id(self) -> str:
+        """Identifies the vector space; stored embeddings are only valid for the same id"""
+        return f"sentence-transformers/{self.model_name}:normalized"
+
+    def load(self):
+        """Load the model once; safe to call from several threads"""
+        if self.model is not None:
+            return self.model
+
+        with self._lock:
+            if self.model is None:
+                from sentence_transformers import SentenceTransformer
+
+                if self.num_threads > 0:
+                    import torch
+                    torch.set_num_threads(self.num_threads)
+
+                self.model = SentenceTransformer(self.model_name)
+                logger.info(f"✅ Embedding model loaded: {self.model_name} (batch_size={self.batch_size}, threads={self.num_threads or 'default'})")
+
+        return self.model
+
+    def encode(self, texts: list) -> list:
+        """Encode texts in vectorized batches, returning plain lists for ChromaDB"""
+        if not texts:
+            return []
+
+        model = self.load()
+        vectors = model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return vectors.tolist()
+
+    def encode_query(self, text: str) -> list:
+        """Encode a single question"""
+        return self.encode([text])[0]
+
+    def probe(self) -> list:
+        """Vector for EMBEDDING_PROBE_TEXT, stored in the manifest to detect incompatible backends"""
+        return [round(value, 6) for value in self.encode_query(EMBEDDING_PROBE_TEXT)]
+
+
+class OnnxEmbeddingEngine(EmbeddingEngine):
+    """The same sentence-transformers model run through onnxruntime
+
+    Reproduces the SentenceTransformer pipeline (tokenize, transformer, mean
+    pooling over the attention mask, L2 normalization) without importing torch.
+    A full-precision export shares the SentenceTransformer vector space; a
+    quantized export gets its own space id, so switching to it re-indexes.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME,
+                 batch_size: int = EMBEDDING_BATCH_SIZE,
+                 num_threads: int = EMBEDDING_THREADS,
+                 onnx_dir: str = EMBEDDING_ONNX_DIR,
+                 onnx_file: str = EMBEDDING_ONNX_FILE,
+                 max_seq_length: int = EMBEDDING_MAX_SEQ_LENGTH):
+        super().__init__(model_name, batch_size, num_threads)
+        self.onnx_dir = onnx_dir
+        self.onnx_file = onnx_file
+        self.max_seq_length = max_seq_length
+        self.tokenizer = None
+        self._input_names = ()
+
+    @property
+    def quantized(self) -> bool:
+        return "int8" in Path(self.onnx_file).name
+
+    @property
+    def space_id(self) -> str:
+        space = f"sentence-transformers/{self.model_name}:normalized"
+        return f"{space}:{Path(self.onnx_file).stem}" if self.quantized else space
+
+    def _resolve(self, filename: str) -> str:
+        if self.onnx_dir:
+            return str(Path(self.onnx_dir) / filename)
+
+        from huggingface_hub import hf_hub_download
+        repo_id = self.model_name if "/" in self.model_name else f"sentence-transformers/{self.model_name}"
+        return hf_hub_download(repo_id, filename)
+
+    def load(self):
+        """Load the ONNX session and tokenizer once; safe to call from several threads"""
+        if self.model is not None:
+            return self.model
+
+        with self._lock:
+            if self.model is None:
+                import onnxruntime
+                from tokenizers import Tokenizer
+
+                tokenizer = Tokenizer.from_file(self._resolve("tokenizer.json"))
+                tokenizer.enable_truncation(max_length=self.max_seq_length)
+                tokenizer.enable_padding()
+
+                options = onnxruntime.SessionOptions()
+                if self.num_threads > 0:
+                    options.intra_op_num_threads = self.num_threads
+                session = onnxruntime.InferenceSession(
+                    self._resolve(self.onnx_file),
+                    sess_options=options,
+                    providers=["CPUExecutionProvider"]
+                )
+
+                self.tokenizer = tokenizer
+                self._input_names = tuple(i.name for i in session.get_inputs())
+                self.model = session
+                logger.info(f"✅ ONNX embedding model loaded: {self.model_name} ({self.onnx_file}, batch_size={self.batch_size}, threads={self.num_threads or 'default'})")
+
+        return self.model
+
+    def _encode_batch(self, session, texts: list) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = session.run(None, {name: feeds[name] for name in self._input_names})[0]
+
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, texts: list) -> list:
+        """Encode texts in batches of similar length so little time goes to padding"""
+        if not texts:
+            return []
+
+        session = self.load()
+        texts = list(texts)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.empty((len(texts), 0), dtype=np.float32)
+
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encoded = self._encode_batch(session, [texts[i] for i in batch])
+            if vectors.shape[1] == 0:
+                vectors = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+            vectors[batch] = encoded
+
+        return vectors.tolist()
+
+
+EMBEDDING_BACKENDS = {
+    "sentence-transformers": EmbeddingEngine,
+    "onnx": OnnxEmbeddingEngine
+}
+
+
+def create_embedding_engine(backend: str = EMBEDDING_BACKEND) -> EmbeddingEngine:
+    """Instantiate the engine for a backend name"""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}, expected one of {sorted(EMBEDDING_BACKENDS)}")
+    return EMBEDDING_BACKENDS[backend]()
+
+
+def probe_similarity(stored_probe: list, probe: list):
+    """Cosine similarity between a stored and a freshly computed probe vector (None if unknown)"""
+    if not stored_probe or len(stored_probe) != len(probe):
+        return None if not stored_probe else 0.0
+    a = np.asarray(stored_probe, dtype=np.float32)
+    b = np.asarray(probe, dtype=np.float32)
+    return float(a @ b / max(np.linalg.norm(a) * np.linalg.norm(b), 1e-12))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_embedding_engine() -> EmbeddingEngine:
+    """Return the process-wide embedding engine"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_embedding_engine()
+    return _engine
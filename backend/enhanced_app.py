@@ -4,7 +4,7 @@ RABuddy Enhanced Backend with PDF Re-embedding
 Features: Better chunking, inline citations, CSU-themed responses
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 import os
 import uuid
@@ -14,10 +14,61 @@ from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 import json
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeout
 
-# Load environment variables
+import numpy as np
+
+# Load environment variables (before the local modules below read their settings)
 load_dotenv()
 
+from answer_cache import AnswerCache, normalize_question
+from concurrency import (
+    LLM_TIMEOUT_SECONDS,
+    REQUEST_TIMEOUT_SECONDS,
+    AdmissionControl,
+    LLMGate,
+    Overloaded,
+    SingleFlight,
+)
+from chunking import histogram_buckets, length_histogram
+from context_builder import build_context, estimate_tokens
+from embeddings import EMBEDDING_PROBE_MIN_SIMILARITY, get_embedding_engine, probe_similarity
+from extractive import EXTRACTIVE_ANSWERS, extractive_answer
+from feedback_log import FEEDBACK_LOG_QUERIES, FEEDBACK_TYPES, FeedbackLog, FeedbackSummary, QueryRegistry
+from index_versions import build_lock, index_dir, new_collection_name, read_active_index, write_active_index
+from ingest_pipeline import INGEST_WRITE_BATCH_SIZE, ingest_pdfs
+from lexical_index import (
+    LEXICAL_INDEX_DIRNAME,
+    LexicalIndex,
+    build_lexical_index,
+    read_index_version,
+    reciprocal_rank_fusion,
+)
+from manifest import (
+    MANIFEST_FILENAME,
+    empty_manifest,
+    load_manifest,
+    manifest_chunk_count,
+    manifest_catalog,
+    manifest_chunk_histogram,
+    manifest_version,
+    plan_changes,
+    record_file,
+    save_manifest,
+)
+from metrics import MetricsRegistry, QueryTrace
+from page_text_store import PAGE_TEXT_DIRNAME, PageTextStore
+from query_embedding_cache import QUERY_EMBEDDING_DIRNAME, QueryEmbeddingCache
+from readiness import WarmupTracker
+from rebuild_jobs import RebuildInProgress, RebuildJobs
+from routing import QUERY_ROUTING, TAGGER_VERSION, document_type, parse_filters, route_query, where_clause
+from sessions import SessionStore, history_for_prompt, rewrite_followup, valid_session_id
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,177 +82,454 @@ CORS(app,
      expose_headers=["Content-Type"],
      supports_credentials=False)
 
+# Storage locations and chunking parameters (part of the ingestion manifest key)
+CHROMA_STORE_PATH = Path(os.getenv('CHROMA_STORE_PATH', Path(__file__).parent / "chroma_store_enhanced"))
+COLLECTION_NAME = "csu_housing_docs_enhanced"
+PDFS_DIR = Path(os.getenv('PDFS_DIR', Path(__file__).parent.parent / "pdfs"))
+CHUNKING_PARAMS = {
+    "strategy": os.getenv('CHUNK_STRATEGY', 'structured'),  # structured | sentences
+    "chunk_size": int(os.getenv('CHUNK_SIZE', 800)),
+    "chunk_overlap": int(os.getenv('CHUNK_OVERLAP', 120)),
+    "chunk_unit": os.getenv('CHUNK_UNIT', 'chars'),  # chars | tokens
+    "sentences_per_chunk": 3,
+    "min_chunk_chars": int(os.getenv('MIN_CHUNK_CHARS', 50))
+}
+
+# Extracted page text by PDF hash, so rebuilds and re-chunking never re-parse unchanged PDFs
+page_store = PageTextStore(CHROMA_STORE_PATH / PAGE_TEXT_DIRNAME)
+
+# Question vectors by normalized text, kept across restarts and shared by workers (bound to the embedding model)
+query_embeddings = QueryEmbeddingCache(CHROMA_STORE_PATH / QUERY_EMBEDDING_DIRNAME)
+
+# Retrieval: dense candidates fused with BM25 candidates, then the best few go to Gemini
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', 5))
+DENSE_CANDIDATES = 8
+DENSE_MAX_DISTANCE = 0.7  # Stricter relevance threshold
+HYBRID_SEARCH = os.getenv('HYBRID_SEARCH', 'true').lower() == 'true'
+BM25_CANDIDATES = int(os.getenv('BM25_CANDIDATES', 8))
+LEXICAL_MAX_DISTANCE = float(os.getenv('LEXICAL_MAX_DISTANCE', 1.2))
+RRF_K = int(os.getenv('RRF_K', 60))
+
 # Global RAG components
 chroma_client = None
 chroma_collection = None
 gemini_model = None
-embedding_model = None
+embedding_engine = None
+lexical_index = None
+index_version = None
+index_catalog = {}  # chunk counts per source, doc_type and topic of the served index (GET /api/sources)
+read_only_index = False  # set in pre-forked workers, which must never write to the index
+index_lock = threading.Lock()  # swaps the served collection and its BM25 index together
+index_build_lock = threading.Lock()  # one index build at a time (startup sync or rebuild job)
+index_refresh_lock = threading.Lock()
+
+# Workers check this often whether another process swapped in a new index version
+INDEX_REFRESH_SECONDS = float(os.getenv('INDEX_REFRESH_SECONDS', 30))
+
+# Background rebuilds into a new index version (POST /api/rebuild)
+rebuild_jobs = RebuildJobs()
+
+# Startup progress per component, reported by /api/ready
+warmup = WarmupTracker(["embeddings", "index", "chromadb", "gemini"])
+
+# Responses for repeated questions, invalidated whenever the index version changes
+answer_cache = AnswerCache()
+
+# Backpressure: bounded in-flight requests and concurrent Gemini calls
+admission = AdmissionControl()
+llm_gate = LLMGate()
+
+# /api/query work runs here so the request thread can give up with a 504 while the query finishes
+query_executor = ThreadPoolExecutor(max_workers=admission.max_in_flight, thread_name_prefix="rabuddy-query")
+
+# Identical questions arriving together share one retrieval and Gemini call
+inflight_queries = SingleFlight()
+
+# Conversation history per session_id, used to rewrite follow-up questions
+sessions = SessionStore()
+
+# Thumbs up/down (/api/feedback): recent query ids -> question and sources, and the append-only log
+recent_queries = QueryRegistry()
+feedback_log = FeedbackLog()
+feedback_summary = FeedbackSummary(feedback_log)
+
+# Batch queries (/api/query/batch): size limit and concurrent generations per batch
+BATCH_MAX_QUESTIONS = int(os.getenv('BATCH_MAX_QUESTIONS', 1000))
+BATCH_GENERATION_WORKERS = int(os.getenv('BATCH_GENERATION_WORKERS', 4))
+
+# Per-stage timings and counters for /metrics (each gunicorn worker reports its own)
+QUERY_DEBUG_TIMINGS = os.getenv('QUERY_DEBUG_TIMINGS', 'false').lower() == 'true'
+metrics = MetricsRegistry()
+stage_latency = metrics.histogram("rabuddy_query_stage_seconds", "Query latency by stage", ("stage",))
+queries_total = metrics.counter("rabuddy_queries_total", "Answered queries by endpoint and answer method", ("endpoint", "method"))
+cache_lookups = metrics.counter("rabuddy_answer_cache_lookups_total", "Answer cache lookups by result", ("result",))
+llm_errors = metrics.counter("rabuddy_llm_errors_total", "Failed Gemini calls by kind", ("kind",))
+feedback_total = metrics.counter("rabuddy_feedback_total", "Feedback received by type", ("type",))
+ingest_durations = {}  # PDF name -> seconds its last ingest took
+metrics.callback("rabuddy_requests_in_flight", "Queries being processed", lambda: admission.stats()["in_flight"])
+metrics.callback("rabuddy_requests_queued", "Queries waiting for a processing slot", lambda: admission.stats()["queued"])
+metrics.callback("rabuddy_requests_rejected_total", "Queries rejected with 429", lambda: admission.stats()["rejected"], kind="counter")
+metrics.callback("rabuddy_llm_in_flight", "Gemini calls in progress", lambda: llm_gate.stats()["in_flight"])
+metrics.callback("rabuddy_llm_slot_timeouts_total", "Queries that gave up waiting for a Gemini slot", lambda: llm_gate.stats()["acquire_timeouts"], kind="counter")
+metrics.callback("rabuddy_coalesced_requests_total", "Queries answered by sharing an identical in-flight query", lambda: inflight_queries.stats()["coalesced"], kind="counter")
+metrics.callback("rabuddy_coalesce_waiting", "Queries currently waiting on an identical in-flight query", lambda: inflight_queries.stats()["waiting"])
+metrics.callback("rabuddy_sessions_active", "Conversation sessions held in memory", lambda: sessions.stats()["sessions"])
+metrics.callback("rabuddy_feedback_queued", "Feedback records waiting for the writer", lambda: feedback_log.stats()["queued"])
+metrics.callback("rabuddy_feedback_dropped_total", "Feedback rejected because the queue was full", lambda: feedback_log.stats()["dropped"], kind="counter")
+metrics.callback("rabuddy_query_embedding_cache_hits_total", "Question vectors served from the embedding cache", lambda: query_embeddings.stats()["memory_hits"] + query_embeddings.stats()["disk_hits"], kind="counter")
+metrics.callback("rabuddy_query_embedding_cache_misses_total", "Question vectors the model had to encode", lambda: query_embeddings.stats()["misses"], kind="counter")
+metrics.callback("rabuddy_ready", "1 once every component is warm", lambda: int(warmup.is_ready()))
+metrics.callback(
+    "rabuddy_ingest_pdf_seconds", "Duration of each PDF's most recent ingest",
+    lambda: {(name,): seconds for name, seconds in list(ingest_durations.items())},
+    labelnames=("pdf",)
+)
 
 def setup_enhanced_embedding():
-    """Setup sentence transformers for better embeddings"""
-    global embedding_model
+    """Load the shared embedding engine used for both ingestion and queries"""
+    global embedding_engine
     try:
-        from sentence_transformers import SentenceTransformer
-        embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        logger.info("✅ Enhanced embedding model loaded")
+        engine = get_embedding_engine()
+        engine.load()
+        query_embeddings.open(engine.space_id)
+        embedding_engine = engine
         return True
     except Exception as e:
         logger.error(f"❌ Failed to load embedding model: {e}")
         return False
 
-def process_pdfs_enhanced():
-    """Process PDFs with better chunking and metadata"""
+def embed_queries(texts: list) -> list:
+    """Question vectors, from the query embedding cache where possible (one encode call for the rest)"""
+    return query_embeddings.encode(texts, embedding_engine.encode)
+
+def embed_query(text: str) -> list:
+    return embed_queries([text])[0]
+
+def ingest_params() -> dict:
+    """Parameters that invalidate stored chunks when they change"""
+    return {**CHUNKING_PARAMS, "embedding_space": get_embedding_engine().space_id, "tagger_version": TAGGER_VERSION}
+
+def active_collection_name() -> str:
+    """Collection currently served: the last swapped-in version, else the pre-versioning collection"""
+    pointer = read_active_index(CHROMA_STORE_PATH)
+    return pointer["collection"] if pointer else COLLECTION_NAME
+
+def active_index_dir() -> Path:
+    """Manifest and BM25 directory of the served collection"""
+    return index_dir(CHROMA_STORE_PATH, active_collection_name(), COLLECTION_NAME)
+
+def serving_index() -> tuple:
+    """(collection, lexical_index) as one consistent pair, even while a rebuild swaps them"""
+    with index_lock:
+        return chroma_collection, lexical_index
+
+def ensure_lexical_index(collection, manifest: dict, directory: Path):
+    """Rebuild the BM25 index next to the version's manifest unless it already matches it"""
+    lexical_path = Path(directory) / LEXICAL_INDEX_DIRNAME
+    version = manifest_version(manifest)
+    if read_index_version(lexical_path) == version:
+        return
+    
+    everything = collection.get(include=['documents'])
+    build_lexical_index(lexical_path, everything['ids'], everything['documents'], version)
+
+def load_lexical_index(expected_version: str, directory: Path):
+    """Memory-map the BM25 index; None (dense-only search) if missing or stale"""
     try:
-        from PyPDF2 import PdfReader
-        from sentence_transformers import SentenceTransformer
-        import chromadb
-        from chromadb.config import Settings
+        index = LexicalIndex(Path(directory) / LEXICAL_INDEX_DIRNAME)
+    except Exception as e:
+        logger.warning(f"⚠️ Lexical index unavailable, using dense search only: {e}")
+        return None
+    
+    if index.index_version != expected_version:
+        logger.warning("⚠️ Lexical index is stale, using dense search only until the next ingest")
+        return None
+    
+    logger.info(f"✅ Lexical index mapped: {index.doc_count} chunks")
+    return index
+
+def copy_pdf_chunks(source, target, pdf_name: str) -> int:
+    """Copy one PDF's chunks and their vectors into another collection without re-embedding"""
+    rows = source.get(where={"source": pdf_name}, include=['documents', 'metadatas', 'embeddings'])
+    for start in range(0, len(rows['ids']), INGEST_WRITE_BATCH_SIZE):
+        end = start + INGEST_WRITE_BATCH_SIZE
+        target.add(
+            ids=rows['ids'][start:end],
+            documents=rows['documents'][start:end],
+            embeddings=rows['embeddings'][start:end],
+            metadatas=rows['metadatas'][start:end]
+        )
+    return len(rows['ids'])
+
+def drop_index_version(chroma_client, name: str):
+    """Delete a version's collection and its manifest / BM25 files"""
+    try:
+        chroma_client.delete_collection(name)
+    except Exception:
+        pass
+    if name == COLLECTION_NAME:
+        (CHROMA_STORE_PATH / MANIFEST_FILENAME).unlink(missing_ok=True)
+        shutil.rmtree(CHROMA_STORE_PATH / LEXICAL_INDEX_DIRNAME, ignore_errors=True)
+    else:
+        shutil.rmtree(index_dir(CHROMA_STORE_PATH, name, COLLECTION_NAME), ignore_errors=True)
+
+def prune_index_versions(chroma_client, keep: set):
+    """Drop index versions other than keep (the new one and the one it replaced,
+    which may still be answering queries that started before the swap)"""
+    for collection in chroma_client.list_collections():
+        name = getattr(collection, "name", collection)  # newer ChromaDB versions list names only
+        if name.startswith(COLLECTION_NAME) and name not in keep:
+            drop_index_version(chroma_client, name)
+            logger.info(f"🗑️ Removed old index version: {name}")
+
+def process_pdfs_enhanced(force: bool = False, progress=None):
+    """Sync PDFs into a new index version and swap it in once it is complete
+
+    The served collection is never modified. Unchanged PDFs (per the ingestion
+    manifest) have their chunks and vectors copied from it, only changed PDFs
+    are extracted and embedded, and removed PDFs are left out. The active-index
+    pointer is replaced only after the new collection, manifest and BM25 index
+    are written, so readers see either the old index or the new one. Nothing is
+    written when no PDF changed. force=True re-embeds everything.
+    progress(**fields) receives the build phase and file counts.
+    """
+    progress = progress or (lambda **fields: None)
+    
+    with index_build_lock, build_lock(CHROMA_STORE_PATH):
+        try:
+            import chromadb
+            from chromadb.config import Settings
+            
+            # Create new ChromaDB client
+            chroma_client = chromadb.PersistentClient(
+                path=str(CHROMA_STORE_PATH),
+                settings=Settings(anonymized_telemetry=False)
+            )
+        except Exception as e:
+            logger.error(f"💥 PDF processing failed: {e}")
+            return False, 0
+        
+        progress(phase="planning")
+        active_name = active_collection_name()
+        active_dir = index_dir(CHROMA_STORE_PATH, active_name, COLLECTION_NAME)
+        try:
+            active = chroma_client.get_collection(active_name, embedding_function=None)
+        except Exception:
+            active = None
         
-        # Initialize components
-        embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Without a served collection its manifest describes nothing, so start clean
+        manifest = load_manifest(active_dir, ingest_params()) if active is not None and not force else empty_manifest(ingest_params())
         
-        # Use existing ChromaDB path or create new one
-        chroma_store_path = Path(__file__).parent / "chroma_store_enhanced"
+        # A collection that disagrees with the manifest can't be trusted, resync everything
+        expected_count = manifest_chunk_count(manifest)
+        if manifest["files"] and active.count() != expected_count:
+            logger.warning(f"⚠️ Collection has {active.count()} chunks but manifest expects {expected_count}, resyncing all PDFs")
+            manifest = empty_manifest(ingest_params())
         
-        # Create new ChromaDB client
-        chroma_client = chromadb.PersistentClient(
-            path=str(chroma_store_path),
-            settings=Settings(anonymized_telemetry=False)
-        )
+        pdf_paths = sorted(PDFS_DIR.glob("*.pdf"))
+        plan = plan_changes(manifest, pdf_paths)
         
-        # Try to get existing collection or create new one
-        collection_name = "csu_housing_docs_enhanced"
-        try:
-            # Try to delete existing collection if it exists
-            chroma_client.delete_collection(collection_name)
-            logger.info(f"🗑️ Removed existing collection: {collection_name}")
-        except:
-            logger.info(f"📝 Creating new collection: {collection_name}")
+        # The embedding space (in the manifest params) is checked for free; the probe vector costs a model load
+        # and an encode, so it is only computed when new vectors will be mixed with the stored ones, or to record it
+        if active is not None and not plan["changed"] and not plan["removed"]:
+            logger.info(f"✅ All {len(plan['unchanged'])} PDFs unchanged, skipping ingestion ({active.count()} chunks)")
+            if manifest["files"] and not manifest.get("embedding_probe"):
+                manifest["embedding_probe"] = get_embedding_engine().probe()
+                save_manifest(active_dir, manifest)  # index built before probes were recorded
+            ensure_lexical_index(active, manifest, active_dir)
+            progress(phase="unchanged")
+            return True, active.count()
         
-        # Create collection with metadata
-        collection = chroma_client.create_collection(
-            name=collection_name,
-            metadata={"description": "CSU Housing & Dining Documents with Enhanced Chunking"}
-        )
+        # Vectors from another backend or export can only be mixed with the stored ones if they agree
+        probe = get_embedding_engine().probe()
+        similarity = probe_similarity(manifest.get("embedding_probe"), probe)
+        if manifest["files"] and similarity is not None and similarity < EMBEDDING_PROBE_MIN_SIMILARITY:
+            logger.warning(f"⚠️ Embedding backend disagrees with the indexed vectors (probe similarity {similarity:.4f}), re-indexing all PDFs")
+            manifest = empty_manifest(ingest_params())
+            plan = plan_changes(manifest, pdf_paths)
         
-        # Process PDFs from the pdfs directory
-        pdfs_dir = Path(__file__).parent.parent / "pdfs"
-        documents = []
-        metadatas = []
-        ids = []
+        logger.info(f"🔍 Ingestion plan: {len(plan['changed'])} changed, {len(plan['unchanged'])} unchanged, {len(plan['removed'])} removed")
         
-        for pdf_path in pdfs_dir.glob("*.pdf"):
-            logger.info(f"📄 Processing: {pdf_path.name}")
+        new_name = new_collection_name(COLLECTION_NAME)
+        new_dir = index_dir(CHROMA_STORE_PATH, new_name, COLLECTION_NAME)
+        try:
+            new_dir.mkdir(parents=True, exist_ok=True)
+            collection = chroma_client.create_collection(
+                name=new_name,
+                metadata={"description": "CSU Housing & Dining Documents with Enhanced Chunking"},
+                embedding_function=None  # No embedding function: vectors always come from the shared engine
+            )
+            new_manifest = empty_manifest(ingest_params())
+            new_manifest["embedding_probe"] = probe
             
-            try:
-                with open(pdf_path, 'rb') as file:
-                    pdf_reader = PdfReader(file)  # Updated to use PdfReader
-                    
-                    for page_num, page in enumerate(pdf_reader.pages):
-                        text = page.extract_text()
-                        
-                        if text.strip():
-                            # Better chunking: split by sentences and group
-                            sentences = text.replace('\n', ' ').split('. ')
-                            
-                            # Create chunks of 3-4 sentences for better context
-                            chunk_size = 3
-                            for i in range(0, len(sentences), chunk_size):
-                                chunk_sentences = sentences[i:i + chunk_size]
-                                chunk_text = '. '.join(chunk_sentences).strip()
-                                
-                                if len(chunk_text) > 50:  # Skip very short chunks
-                                    doc_id = f"{pdf_path.stem}_page_{page_num + 1}_chunk_{i // chunk_size + 1}"
-                                    
-                                    documents.append(chunk_text)
-                                    metadatas.append({
-                                        "source": pdf_path.name,
-                                        "page": page_num + 1,
-                                        "chunk_id": i // chunk_size + 1,
-                                        "doc_type": "csu_housing_policy",
-                                        "total_pages": len(pdf_reader.pages)
-                                    })
-                                    ids.append(doc_id)
+            counts = {"files_done": 0, "chunks_written": 0}
+            progress(phase="copying", files_total=len(plan["unchanged"]) + len(plan["changed"]), **counts)
             
-            except Exception as e:
-                logger.error(f"❌ Failed to process {pdf_path.name}: {e}")
-                continue
-        
-        # Add documents to ChromaDB in batches
-        batch_size = 100
-        for i in range(0, len(documents), batch_size):
-            batch_docs = documents[i:i + batch_size]
-            batch_metas = metadatas[i:i + batch_size]
-            batch_ids = ids[i:i + batch_size]
+            for name in plan["unchanged"]:
+                counts["chunks_written"] += copy_pdf_chunks(active, collection, name)
+                counts["files_done"] += 1
+                new_manifest["files"][name] = manifest["files"][name]
+                progress(**counts)
             
-            collection.add(
-                documents=batch_docs,
-                metadatas=batch_metas,
-                ids=batch_ids
+            for name in plan["removed"]:
+                ingest_durations.pop(name, None)
+                logger.info(f"🗑️ Leaving out chunks of deleted PDF: {name}")
+            
+            hashes = {pdf_path.name: sha256 for pdf_path, sha256 in plan["changed"]}
+            
+            def on_file_done(pdf_path, chunk_lengths, total_pages, seconds, topics):
+                record_file(new_manifest, pdf_path.name, hashes[pdf_path.name], len(chunk_lengths), total_pages,
+                            seconds, length_histogram(chunk_lengths), document_type(pdf_path.name), topics)
+                save_manifest(new_dir, new_manifest)
+                ingest_durations[pdf_path.name] = seconds
+                counts["files_done"] += 1
+                counts["chunks_written"] += len(chunk_lengths)
+                progress(**counts)
+                logger.info(f"✅ {pdf_path.name}: {len(chunk_lengths)} chunks in {seconds:.2f}s")
+            
+            failed_files = []
+            
+            def on_file_failed(pdf_path):
+                # Keep serving the previous version's chunks; the old hash in the manifest makes the next sync retry it
+                failed_files.append(pdf_path.name)
+                if active is not None and pdf_path.name in manifest["files"]:
+                    counts["chunks_written"] += copy_pdf_chunks(active, collection, pdf_path.name)
+                    new_manifest["files"][pdf_path.name] = manifest["files"][pdf_path.name]
+                    save_manifest(new_dir, new_manifest)
+                    logger.warning(f"⚠️ Keeping the previous chunks of {pdf_path.name}")
+                counts["files_done"] += 1
+                progress(failed_files=list(failed_files), **counts)
+            
+            progress(phase="embedding")
+            
+            # Extraction runs in a process pool while this thread embeds and writes batches
+            embedded_chunks = ingest_pdfs(
+                collection,
+                [pdf_path for pdf_path, _ in plan["changed"]],
+                CHUNKING_PARAMS,
+                get_embedding_engine().encode,
+                on_file_done,
+                on_file_failed,
+                page_store=page_store,
+                pdf_hashes=hashes
             )
+            
+            progress(phase="indexing")
+            save_manifest(new_dir, new_manifest)
+            ensure_lexical_index(collection, new_manifest, new_dir)
+            
+            total_chunks = collection.count()
+            if total_chunks != manifest_chunk_count(new_manifest):
+                raise RuntimeError(f"new collection has {total_chunks} chunks but its manifest expects {manifest_chunk_count(new_manifest)}")
+            
+            # The swap: one atomic rename of the pointer file
+            progress(phase="swapping")
+            write_active_index(CHROMA_STORE_PATH, new_name, previous=active_name if active is not None else None)
+            
+        except Exception as e:
+            logger.error(f"💥 PDF processing failed, keeping the current index: {e}")
+            drop_index_version(chroma_client, new_name)
+            return False, 0
         
-        logger.info(f"✅ Successfully processed {len(documents)} document chunks")
-        logger.info(f"📚 Documents from {len(list(pdfs_dir.glob('*.pdf')))} PDF files")
+        logger.info(f"🔀 Swapped in index version {new_name}")
+        prune_index_versions(chroma_client, {new_name, active_name})
+        page_store.prune({entry["sha256"] for entry in new_manifest["files"].values()})
         
-        return True, len(documents)
+        logger.info(f"✅ Successfully embedded {embedded_chunks} new document chunks")
+        logger.info(f"📚 Collection holds {total_chunks} chunks from {len(new_manifest['files'])} PDF files")
+        buckets = histogram_buckets(manifest_chunk_histogram(new_manifest))
+        logger.info("📏 Chunk lengths: " + ", ".join(f"{label}: {count}" for label, count in buckets.items()))
+        
+        return True, total_chunks
+
+def connect_chromadb():
+    """Open the active index version for querying (never creates or modifies it)
+
+    Called again after a rebuild: the new collection and its BM25 index are
+    swapped in together, and queries already running finish on the old ones.
+    """
+    global chroma_client, chroma_collection, index_version, lexical_index, index_catalog
+    
+    try:
+        import chromadb
+        from chromadb.config import Settings
+        
+        client = chromadb.PersistentClient(
+            path=str(CHROMA_STORE_PATH),
+            settings=Settings(anonymized_telemetry=False)
+        )
+        
+        name = active_collection_name()
+        directory = index_dir(CHROMA_STORE_PATH, name, COLLECTION_NAME)
+        collection = client.get_collection(name, embedding_function=None)
+        actual_count = collection.count()
+        
+        # Cached answers are only valid for the corpus they were generated from
+        manifest = load_manifest(directory, ingest_params())
+        version = manifest_version(manifest)
+        
+        # BM25 index built at ingest, memory-mapped so loading is nearly free
+        lexical = load_lexical_index(version, directory)
+        
+        with index_lock:
+            chroma_client, chroma_collection, index_version, lexical_index = client, collection, version, lexical
+            index_catalog = manifest_catalog(manifest)
+        answer_cache.set_index_version(version)
+        logger.info(f"✅ Connected to ChromaDB: {actual_count} enhanced document chunks ({name})")
+        
+        # The index may have been built by another process, so take ingest timings from the manifest
+        ingest_durations.clear()
+        ingest_durations.update({
+            name: entry["ingest_seconds"]
+            for name, entry in manifest["files"].items()
+            if entry.get("ingest_seconds") is not None
+        })
+        return True
         
     except Exception as e:
-        logger.error(f"💥 PDF processing failed: {e}")
-        return False, 0
+        logger.error(f"❌ ChromaDB connection failed: {e}")
+        return False
 
-def initialize_enhanced_rag():
-    """Initialize enhanced RAG system"""
-    global chroma_client, chroma_collection, gemini_model
+def setup_gemini():
+    """Configure the Gemini client (no network call; the first query validates the key)"""
+    global gemini_model
     
+    try:
+        import google.generativeai as genai
+        
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            logger.error("❌ GEMINI_API_KEY not found")
+            return False
+        
+        genai.configure(api_key=api_key)
+        gemini_model = genai.GenerativeModel('gemini-1.5-flash')
+        logger.info("✅ Gemini model configured")
+        return True
+        
+    except Exception as e:
+        logger.error(f"❌ Gemini initialization failed: {e}")
+        return False
+
+def initialize_enhanced_rag(force_rebuild: bool = False):
+    """Initialize enhanced RAG system, recording each step in the warm-up tracker"""
     try:
         logger.info("🚀 Initializing Enhanced RAG system...")
         
         # 1. Setup embeddings
-        if not setup_enhanced_embedding():
+        if not warmup.run("embeddings", setup_enhanced_embedding):
             return False
         
-        # 2. Process PDFs with enhanced chunking
-        success, doc_count = process_pdfs_enhanced()
-        if not success:
+        # 2. Sync changed PDFs into the collection
+        if not warmup.run("index", lambda: process_pdfs_enhanced(force=force_rebuild)[0]):
             return False
         
         # 3. Initialize ChromaDB connection
-        try:
-            import chromadb
-            from chromadb.config import Settings
-            
-            chroma_store_path = Path(__file__).parent / "chroma_store_enhanced"
-            chroma_client = chromadb.PersistentClient(
-                path=str(chroma_store_path),
-                settings=Settings(anonymized_telemetry=False)
-            )
-            
-            chroma_collection = chroma_client.get_collection("csu_housing_docs_enhanced")
-            actual_count = chroma_collection.count()
-            logger.info(f"✅ Connected to ChromaDB: {actual_count} enhanced document chunks")
-            
-        except Exception as e:
-            logger.error(f"❌ ChromaDB connection failed: {e}")
+        if not warmup.run("chromadb", connect_chromadb):
             return False
         
         # 4. Initialize Gemini
-        try:
-            import google.generativeai as genai
-            
-            api_key = os.getenv('GEMINI_API_KEY')
-            if not api_key:
-                logger.error("❌ GEMINI_API_KEY not found")
-                return False
-            
-            genai.configure(api_key=api_key)
-            gemini_model = genai.GenerativeModel('gemini-1.5-flash')
-            
-            # Test connection
-            test_response = gemini_model.generate_content("Hello")
-            logger.info("✅ Gemini model initialized and tested")
-            
-        except Exception as e:
-            logger.error(f"❌ Gemini initialization failed: {e}")
+        if not warmup.run("gemini", setup_gemini):
             return False
         
         logger.info("🎉 Enhanced RAG system initialized successfully!")
@@ -211,66 +539,324 @@ def initialize_enhanced_rag():
         logger.error(f"💥 Enhanced RAG initialization failed: {e}")
         return False
 
-def query_enhanced_rag(question: str) -> dict:
-    """Enhanced RAG query with better context and inline citations"""
+def start_background_warmup(target=initialize_enhanced_rag, on_done=None):
+    """Warm components in a background thread so the server can bind immediately
+
+    on_done(success) is called when warm-up finishes.
+    """
+    def run():
+        success = target()
+        if on_done:
+            on_done(success)
+    
+    thread = threading.Thread(target=run, name="rabuddy-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def build_index_once(status=None, done=None):
+    """Leader step for multi-process serving: sync the index once for all workers
+
+    Runs in its own process so the serving master never executes model
+    inference before forking workers. The outcome is published through the
+    shared status value (0 = ready) and done event when provided.
+    """
     try:
-        session_id = str(uuid.uuid4())
-        
-        if not chroma_collection or not gemini_model or not embedding_model:
-            return {
-                "answer": "Enhanced RAG system not properly initialized.",
-                "sources": [],
-                "session_id": session_id,
-                "method": "error"
-            }
-        
-        # Query ChromaDB with enhanced search
+        success, doc_count = process_pdfs_enhanced()
+    except Exception as e:
+        logger.error(f"💥 Index build failed: {e}")
+        success = False
+    
+    if status is not None:
+        status.value = 0 if success else 1
+    if done is not None:
+        done.set()
+    raise SystemExit(0 if success else 1)
+
+def build_index_version(force, updates):
+    """Rebuild step for multi-process serving: build a new index version in a spawned process
+
+    Progress fields go to the updates queue as ("progress", fields), followed
+    by ("done", success, doc_count). The worker that started it relays them to
+    its rebuild job; every worker picks up the new version via refresh_index().
+    """
+    try:
+        success, doc_count = process_pdfs_enhanced(force=force, progress=lambda **fields: updates.put(("progress", fields)))
+    except Exception as e:
+        logger.error(f"💥 Index build failed: {e}")
+        success, doc_count = False, 0
+    updates.put(("done", success, doc_count))
+
+def build_in_subprocess(job) -> tuple:
+    """Run a rebuild job's build in its own process, relaying its progress; returns (success, doc_count)"""
+    spawn = multiprocessing.get_context("spawn")
+    updates = spawn.Queue()
+    builder = spawn.Process(target=build_index_version, args=(job.force, updates), name="rabuddy-index-rebuilder")
+    builder.start()
+    logger.info(f"🏗️ Rebuild {job.id} building in pid {builder.pid}")
+    
+    outcome = (False, 0)
+    while True:
         try:
-            search_results = chroma_collection.query(
-                query_texts=[question],
-                n_results=8,  # Get more results for better context
-                include=['documents', 'metadatas', 'distances']
-            )
-            
-            relevant_docs = []
-            if search_results['documents'] and search_results['documents'][0]:
-                for i, doc in enumerate(search_results['documents'][0]):
-                    metadata = search_results['metadatas'][0][i] if search_results['metadatas'][0] else {}
-                    distance = search_results['distances'][0][i] if search_results['distances'][0] else 1.0
-                    
-                    # Only include highly relevant documents
-                    if distance < 0.7:  # Stricter relevance threshold
-                        relevant_docs.append({
+            message = updates.get(timeout=0.5)
+        except queue.Empty:
+            if builder.is_alive():
+                continue
+            try:
+                message = updates.get_nowait()  # sent just before exiting
+            except queue.Empty:
+                break
+        if message[0] == "progress":
+            job.update(**message[1])
+        else:
+            outcome = (message[1], message[2])
+    builder.join()
+    return outcome
+
+def refresh_index() -> bool:
+    """Reconnect if another process swapped in a new index version; True when this process switched"""
+    served = chroma_collection.name if chroma_collection is not None else None
+    if served is None or active_collection_name() == served:
+        return False
+    if not index_refresh_lock.acquire(blocking=False):
+        return False  # another thread is already reconnecting
+    try:
+        logger.info(f"🔄 Active index changed from {served} to {active_collection_name()}, reconnecting")
+        return connect_chromadb()
+    finally:
+        index_refresh_lock.release()
+
+def start_index_refresher():
+    """Poll the active-index pointer every INDEX_REFRESH_SECONDS in a background thread"""
+    def run():
+        while True:
+            time.sleep(INDEX_REFRESH_SECONDS)
+            try:
+                refresh_index()
+            except Exception as e:
+                logger.error(f"💥 Index refresh failed: {e}")
+    
+    thread = threading.Thread(target=run, name="rabuddy-index-refresh", daemon=True)
+    thread.start()
+    return thread
+
+def initialize_worker(wait_for_index=None):
+    """Per-worker setup after fork: open the prebuilt index read-only and connect Gemini
+
+    Workers never write to the index themselves: rebuilds run in a spawned
+    process, and each worker follows the active-index pointer. wait_for_index()
+    blocks until the leader's index build finishes and returns whether it succeeded.
+    """
+    global read_only_index
+    read_only_index = True
+    
+    if not warmup.run("embeddings", setup_enhanced_embedding):  # no-op when preloaded before fork
+        return False
+    if not warmup.run("index", wait_for_index or (lambda: True)):
+        return False
+    if not warmup.run("chromadb", connect_chromadb):
+        return False
+    start_index_refresher()
+    return warmup.run("gemini", setup_gemini)
+
+def lookup_cached_answer(question: str, trace: QueryTrace):
+    """Check the answer cache: exact text first, then similar question embeddings
+
+    Returns (cached_result, cache_layer, cache_key, query_embedding). The embedding
+    is computed on an exact-match miss and reused for the Chroma search.
+    """
+    cache_key = normalize_question(question)
+    with trace.span("cache_lookup"):
+        cached = answer_cache.get_exact(cache_key)
+    if cached is not None:
+        return cached, "exact", cache_key, None
+    
+    with trace.span("embed"):
+        query_embedding = embed_query(question)
+    with trace.span("cache_lookup"):
+        cached = answer_cache.get_similar(query_embedding)
+    return cached, "semantic", cache_key, query_embedding
+
+def resolve_route(question: str, filters: dict = None) -> dict:
+    """Search scope for a question: the request's filters, else the router's pick, else None (whole index)"""
+    if filters:
+        return {"filters": filters, "source": "explicit"}
+    if not QUERY_ROUTING:
+        return None
+    
+    filters, reason = route_query(question, index_catalog)
+    if filters is None:
+        return None
+    logger.info(f"🧭 Routed to {filters} ({reason})")
+    return {"filters": filters, "source": "auto", "reason": reason}
+
+def retrieve_relevant_docs(question: str, query_embedding, route: dict = None) -> tuple:
+    """Hybrid search for one question; returns (relevant_docs, total_chunks_searched)"""
+    return retrieve_relevant_docs_batch([question], [query_embedding], [route])[0]
+
+def retrieve_relevant_docs_batch(questions: list, query_embeddings: list, routes: list = None) -> list:
+    """Hybrid search for many questions, each within its route's filters
+
+    Questions with the same filters share one search. An automatic route that
+    finds nothing relevant is retried on the whole index and marked
+    route["fallback"]; explicit filters are never widened.
+    Returns one (relevant_docs, total_chunks_searched) per question.
+    """
+    routes = routes or [None] * len(questions)
+    groups = {}
+    for i, route in enumerate(routes):
+        filters = route["filters"] if route else None
+        groups.setdefault(json.dumps(filters, sort_keys=True), (filters, []))[1].append(i)
+    
+    results = [None] * len(questions)
+    for filters, indices in groups.values():
+        found = search_index([questions[i] for i in indices], [query_embeddings[i] for i in indices], where_clause(filters))
+        for i, result in zip(indices, found):
+            results[i] = result
+    
+    retry = [i for i, route in enumerate(routes) if route and route["source"] == "auto" and not results[i][0]]
+    if retry:
+        logger.info(f"🧭 Routed search found nothing for {len(retry)} question(s), searching the whole index")
+        for i, result in zip(retry, search_index([questions[i] for i in retry], [query_embeddings[i] for i in retry])):
+            results[i] = result
+            routes[i]["fallback"] = True
+    return results
+
+def search_index(questions: list, query_embeddings: list, where: dict = None) -> list:
+    """Hybrid search: dense ChromaDB hits fused with BM25 hits by reciprocal rank
+
+    All questions share one multi-query Chroma search and one fetch of their
+    lexical-only hits, both limited to chunks matching where. Dense hits must
+    pass the strict distance threshold; exact-term (BM25) hits such as
+    building names or phone extensions get a looser one.
+    Returns one (relevant_docs, total_chunks_searched) per question.
+    """
+    collection, lexical = serving_index()
+    scope = {"where": where} if where else {}
+    try:
+        search_results = collection.query(
+            query_embeddings=list(query_embeddings),
+            n_results=DENSE_CANDIDATES,
+            include=['documents', 'metadatas', 'distances'],
+            **scope
+        )
+        
+        candidate_sets = []
+        dense_rankings = []
+        for q in range(len(questions)):
+            candidates = {}
+            dense_ranking = []
+            if search_results['documents'] and search_results['documents'][q]:
+                for i, doc in enumerate(search_results['documents'][q]):
+                    doc_id = search_results['ids'][q][i]
+                    candidates[doc_id] = {
+                        "content": doc,
+                        "metadata": search_results['metadatas'][q][i] if search_results['metadatas'][q] else {},
+                        "distance": search_results['distances'][q][i] if search_results['distances'][q] else 1.0
+                    }
+                    dense_ranking.append(doc_id)
+            candidate_sets.append(candidates)
+            dense_rankings.append(dense_ranking)
+        
+        lexical_rankings = [[] for _ in questions]
+        if HYBRID_SEARCH and lexical is not None:
+            lexical_rankings = [[doc_id for doc_id, _ in lexical.search(question, BM25_CANDIDATES)] for question in questions]
+            missing = sorted({
+                doc_id
+                for ranking, candidates in zip(lexical_rankings, candidate_sets)
+                for doc_id in ranking if doc_id not in candidates
+            })
+            if missing:
+                # Fetch lexical-only hits and score them in the same (squared L2) space as Chroma
+                fetched = collection.get(ids=missing, include=['documents', 'metadatas', 'embeddings'], **scope)
+                rows = {
+                    doc_id: (doc, metadata, np.asarray(embedding, dtype=np.float32))
+                    for doc_id, doc, metadata, embedding in zip(fetched['ids'], fetched['documents'], fetched['metadatas'], fetched['embeddings'])
+                }
+                for ranking, candidates, query_embedding in zip(lexical_rankings, candidate_sets, query_embeddings):
+                    query_vector = np.asarray(query_embedding, dtype=np.float32)
+                    for doc_id in ranking:
+                        if doc_id in candidates or doc_id not in rows:
+                            continue
+                        doc, metadata, embedding = rows[doc_id]
+                        candidates[doc_id] = {
                             "content": doc,
-                            "metadata": metadata,
-                            "relevance_score": round(1 - distance, 3),
-                            "source_number": len(relevant_docs) + 1
-                        })
-            
-            logger.info(f"Found {len(relevant_docs)} highly relevant documents")
-            
-        except Exception as e:
-            logger.error(f"ChromaDB query failed: {e}")
-            relevant_docs = []
+                            "metadata": metadata or {},
+                            "distance": float(np.sum((embedding - query_vector) ** 2))
+                        }
+            if where:
+                # BM25 ranks the whole index; out-of-scope hits weren't fetched and mustn't take up ranks
+                lexical_rankings = [
+                    [doc_id for doc_id in ranking if doc_id in candidates]
+                    for ranking, candidates in zip(lexical_rankings, candidate_sets)
+                ]
         
-        # Generate enhanced response with inline citations
-        try:
-            source_map = {}  # Initialize source_map early to avoid NameError
+        return [
+            (rank_candidates(candidates, dense_ranking, lexical_ranking), len(candidates))
+            for candidates, dense_ranking, lexical_ranking in zip(candidate_sets, dense_rankings, lexical_rankings)
+        ]
+        
+    except Exception as e:
+        logger.error(f"ChromaDB query failed: {e}")
+        return [([], 0) for _ in questions]
+
+def rank_candidates(candidates: dict, dense_ranking: list, lexical_ranking: list) -> list:
+    """Fuse one question's rankings and keep the top chunks that pass the distance thresholds"""
+    if lexical_ranking:
+        ranking = reciprocal_rank_fusion([dense_ranking, lexical_ranking], k=RRF_K)
+    else:
+        ranking = dense_ranking
+    lexical_hits = set(lexical_ranking)
+    
+    relevant_docs = []
+    for doc_id in ranking:
+        candidate = candidates.get(doc_id)
+        if candidate is None:
+            continue
+        
+        # Only include highly relevant documents
+        max_distance = LEXICAL_MAX_DISTANCE if doc_id in lexical_hits else DENSE_MAX_DISTANCE
+        if candidate["distance"] < max_distance:
+            relevant_docs.append({
+                "content": candidate["content"],
+                "metadata": candidate["metadata"],
+                "relevance_score": round(max(0.0, 1 - candidate["distance"]), 3),
+                "source_number": len(relevant_docs) + 1
+            })
+        if len(relevant_docs) >= RETRIEVAL_TOP_K:
+            break
+    
+    logger.info(f"Found {len(relevant_docs)} highly relevant documents ({len(dense_ranking)} dense, {len(lexical_ranking)} lexical candidates)")
+    return relevant_docs
+
+def build_prompt(question: str, relevant_docs: list, history: list = None) -> tuple:
+    """Build the Gemini prompt with numbered sources; returns (prompt, source_map)
+
+    history holds earlier turns of the conversation (already trimmed to the
+    history token budget) for follow-up questions.
+    """
+    source_map = {}
+    conversation = ""
+    if history:
+        turns = "\n".join(f"RA: {turn['question']}\nRABuddy: {turn['answer']}" for turn in history)
+        conversation = f"""
+CONVERSATION SO FAR (use it only to understand what the question refers to):
+{turns}
+"""
+    
+    if relevant_docs:
+        # Create context with source numbers
+        context_parts = []
+        
+        for doc in relevant_docs:
+            source_num = doc["source_number"]
+            source_info = f"{doc['metadata'].get('source', 'Unknown')} (Page {doc['metadata'].get('page', 'Unknown')})"
+            source_map[source_num] = source_info
             
-            if relevant_docs:
-                # Create context with source numbers
-                context_parts = []
-                
-                for doc in relevant_docs[:6]:  # Use top 6 documents
-                    source_num = doc["source_number"]
-                    source_info = f"{doc['metadata'].get('source', 'Unknown')} (Page {doc['metadata'].get('page', 'Unknown')})"
-                    source_map[source_num] = source_info
-                    
-                    context_parts.append(f"[Source {source_num}] {doc['content']}")
-                
-                context = "\n\n".join(context_parts)
-                
-                prompt = f"""You are RABuddy, the official AI assistant for Colorado State University Housing & Dining Services.
+            context_parts.append(f"[Source {source_num}] {doc.get('context', doc['content'])}")
+        
+        context = "\n\n".join(context_parts)
+        
+        prompt = f"""You are RABuddy, the official AI assistant for Colorado State University Housing & Dining Services.
 
 You help Resident Assistants (RAs) and housing staff with policy questions, procedures, and resident support.
 
@@ -281,6 +867,7 @@ INSTRUCTIONS:
 4. If information isn't in the context, clearly state that
 5. Use a professional but friendly tone appropriate for CSU staff
 
+{conversation}
 CONTEXT FROM CSU HOUSING DOCUMENTS:
 {context}
 
@@ -294,8 +881,8 @@ RESPONSE GUIDELINES:
 - If the context doesn't fully answer the question, acknowledge this and suggest contacting Housing & Dining Services
 
 Please provide a comprehensive answer with proper citations:"""
-            else:
-                prompt = f"""You are RABuddy, the AI assistant for CSU Housing & Dining Services.
+    else:
+        prompt = f"""You are RABuddy, the AI assistant for CSU Housing & Dining Services.
 
 QUESTION: {question}
 
@@ -309,54 +896,548 @@ For accurate and up-to-date information about CSU Housing & Dining policies and
 4. Reviewing the most current housing contract and policies
 
 Is there a different housing-related question I can help you with?"""
+    
+    return prompt, source_map
+
+def format_sources(relevant_docs: list) -> list:
+    """Prepare sources for frontend"""
+    formatted_sources = []
+    for doc in relevant_docs[:5]:
+        formatted_sources.append({
+            "source_number": doc["source_number"],
+            "filename": doc["metadata"].get("source", "Unknown Document"),
+            "page_number": doc["metadata"].get("page", 0),
+            "relevance_score": doc["relevance_score"],
+            "text_preview": doc["content"][:200] + "...",
+            "metadata": doc["metadata"]
+        })
+    return formatted_sources
+
+def generation_fallback(relevant_docs: list, session_id: str, error: Exception) -> dict:
+    """Response used when Gemini generation fails"""
+    return {
+        "answer": "I'm sorry, I encountered an issue generating a response. Please try rephrasing your question or contact CSU Housing & Dining Services directly at (970) 491-5136.",
+        "sources": [{"source_number": i+1, "filename": doc["metadata"].get("source", "Unknown"), "text_preview": doc["content"][:200] + "..."} for i, doc in enumerate(relevant_docs[:3])],
+        "session_id": session_id,
+        "method": "fallback",
+        "error": str(error)
+    }
+
+def not_initialized_response(session_id: str) -> dict:
+    """Response used before the RAG components are loaded"""
+    return {
+        "answer": "Enhanced RAG system not properly initialized.",
+        "sources": [],
+        "session_id": session_id,
+        "method": "error"
+    }
+
+def cached_response(cached: dict, cache_layer: str, session_id: str) -> dict:
+    """A cached answer under this request's session_id"""
+    logger.info(f"Answer cache hit ({cache_layer})")
+    return {
+        **cached,
+        "session_id": session_id,
+        "processing_info": {**cached.get("processing_info", {}), "cache": cache_layer}
+    }
+
+def prepare_query(question: str, session_id: str, trace: QueryTrace, extractive: bool = None,
+                  history: list = None, search_query: str = None, filters: dict = None) -> dict:
+    """Everything before generation: cache lookup, retrieval and prompt building
+
+    Returns a query plan. When plan["response"] is set the question was answered
+    (or rejected) without calling Gemini. With extractive (default EXTRACTIVE_ANSWERS),
+    confident lookups are answered from the top chunk instead of generating.
+    search_query (a rewritten follow-up) replaces the question for caching and
+    retrieval; history goes into the prompt. filters (parsed by parse_filters)
+    limit the search and bypass the answer cache; without them the router may
+    pick a scope.
+    """
+    search_query = search_query or question
+    if not chroma_collection or not gemini_model or not embedding_engine:
+        return {"response": not_initialized_response(session_id)}
+    
+    if filters:
+        # Cached answers came from the whole index (or the router's scope), so scoped questions skip the cache
+        cache_key = None
+        with trace.span("embed"):
+            query_embedding = embed_query(search_query)
+    else:
+        # Serve repeated questions from the answer cache
+        cached, cache_layer, cache_key, query_embedding = lookup_cached_answer(search_query, trace)
+        cache_lookups.inc(result=cache_layer if cached is not None else ("miss" if answer_cache.enabled else "disabled"))
+        if cached is not None:
+            return {"response": cached_response(cached, cache_layer, session_id)}
+    
+    # Query ChromaDB with enhanced search
+    route = resolve_route(search_query, filters)
+    with trace.span("search"):
+        relevant_docs, total_searched = retrieve_relevant_docs(search_query, query_embedding, route)
+    
+    return plan_query(question, session_id, trace, cache_key, query_embedding, relevant_docs, total_searched,
+                      extractive, history, search_query, route)
+
+def plan_query(question: str, session_id: str, trace: QueryTrace, cache_key: str, query_embedding,
+               relevant_docs: list, total_searched: int, extractive: bool = None,
+               history: list = None, search_query: str = None, route: dict = None) -> dict:
+    """Build the query plan from retrieved chunks (the part of prepare_query after search)
+
+    A cache_key of None keeps the answer out of the answer cache, as does
+    history: an answer shaped by one conversation isn't reused for others.
+    """
+    search_query = search_query or question
+    if history:
+        cache_key = None
+    
+    # Dedupe, trim and pack the chunks under the prompt token budget
+    with trace.span("context"):
+        context_docs, context_stats = build_context(search_query, relevant_docs)
+        prompt, source_map = build_prompt(question, context_docs, history)
+    context_stats["prompt_tokens"] = estimate_tokens(prompt)
+    if history:
+        context_stats["history_turns"] = len(history)
+    logger.info(f"Prompt ~{context_stats['prompt_tokens']} tokens ({context_stats['context_tokens']} context, {context_stats['chunks_used']}/{context_stats['chunks_considered']} chunks)")
+    
+    plan = {
+        "response": None,
+        "session_id": session_id,
+        "cache_key": cache_key,
+        "query_embedding": query_embedding,
+        "relevant_docs": context_docs,
+        "total_searched": total_searched,
+        "prompt": prompt,
+        "source_map": source_map,
+        "context_stats": context_stats,
+        "route": route
+    }
+    
+    # Plain lookups with one clearly best chunk are quoted directly, skipping the Gemini round trip
+    if EXTRACTIVE_ANSWERS if extractive is None else extractive:
+        with trace.span("extractive"):
+            answer, extractive_info = extractive_answer(search_query, context_docs)
+        context_stats["extractive"] = extractive_info
+        if answer is not None:
+            logger.info(f"Extractive answer (score {extractive_info['top_score']}, margin {extractive_info['margin']})")
+            plan.update({
+                "relevant_docs": context_docs[:1],
+                "source_map": {1: source_map[1]},
+                "context_stats": {**context_stats, "prompt_tokens": 0}
+            })
+            plan["response"] = complete_query(plan, answer, method="extractive", cache=False)
+    
+    return plan
+
+def complete_query(plan: dict, answer: str, method: str = "enhanced_rag_gemini", cache: bool = True) -> dict:
+    """Build the response for an answer and cache it (extractive answers are cheaper to recompute than to cache)"""
+    relevant_docs = plan["relevant_docs"]
+    result = {
+        "answer": answer,
+        "sources": format_sources(relevant_docs),
+        "session_id": plan["session_id"],
+        "method": method,
+        "document_count": len(relevant_docs),
+        "processing_info": {
+            "total_chunks_searched": plan["total_searched"],
+            "relevant_chunks_used": len(relevant_docs),
+            "citation_sources": len(plan["source_map"]),
+            "prompt_tokens": plan["context_stats"]["prompt_tokens"],
+            "context": plan["context_stats"],
+            "cache": "miss" if plan["cache_key"] is not None else "bypass"
+        }
+    }
+    if plan["route"]:
+        result["processing_info"]["route"] = plan["route"]
+    if cache and plan["cache_key"] is not None:
+        answer_cache.put(plan["cache_key"], plan["query_embedding"], result)
+    return result
+
+def generate_answer(prompt: str, trace: QueryTrace) -> str:
+    """One Gemini call, holding an LLM slot for its whole duration"""
+    queued = time.perf_counter()
+    with llm_gate.slot():
+        trace.record("llm_wait", time.perf_counter() - queued)
+        with trace.span("generate"):
+            response = gemini_model.generate_content(
+                prompt,
+                request_options={"timeout": LLM_TIMEOUT_SECONDS}
+            )
+    return response.text
+
+def llm_error_kind(e: Exception) -> str:
+    """Label for rabuddy_llm_errors_total"""
+    if isinstance(e, Overloaded):
+        return "overloaded"
+    name = type(e).__name__.lower()
+    if isinstance(e, TimeoutError) or "timeout" in name or "deadline" in name:
+        return "timeout"
+    return "error"
+
+def finish_query(result: dict, trace: QueryTrace, endpoint: str, debug: bool = False, query_id: str = None,
+                 question: str = None) -> dict:
+    """Close the query's trace, count it, give it a query_id and attach stage timings when debugging
+
+    With the question, the query_id is remembered (and logged, for votes that reach
+    another worker) so feedback on it can name the question and sources.
+    """
+    trace.finish()
+    queries_total.inc(endpoint=endpoint, method=result.get("method", "unknown"))
+    result = {**result, "query_id": query_id or str(uuid.uuid4())}
+    if question is not None:
+        context = recent_queries.remember(result["query_id"], question, result)
+        if FEEDBACK_LOG_QUERIES:
+            feedback_log.submit({"kind": "query", "query_id": result["query_id"],
+                                 "timestamp": datetime.now().isoformat(), **context})
+    if debug or QUERY_DEBUG_TIMINGS:
+        result = {**result, "processing_info": {**result.get("processing_info", {}), "timings_ms": trace.timings_ms()}}
+    return result
+
+def query_error(e: Exception) -> dict:
+    """Response used when query processing itself fails"""
+    return {
+        "answer": "I'm sorry, I encountered an error processing your question. Please try again or contact CSU Housing & Dining Services.",
+        "sources": [],
+        "session_id": str(uuid.uuid4()),
+        "method": "error",
+        "error": str(e)
+    }
+
+def answer_plan(plan: dict, trace: QueryTrace) -> dict:
+    """Generate the answer for a prepared plan; Gemini failures become the fallback response
+
+    Raises Overloaded when no LLM slot frees up in time.
+    """
+    # Generate enhanced response with inline citations
+    try:
+        return complete_query(plan, generate_answer(plan["prompt"], trace))
+        
+    except Overloaded:
+        llm_errors.inc(kind="overloaded")
+        raise
+    except Exception as e:
+        logger.error(f"Gemini generation failed: {e}")
+        llm_errors.inc(kind=llm_error_kind(e))
+        return generation_fallback(plan["relevant_docs"], plan["session_id"], e)
+
+def resolve_session(question: str, session_id: str = None) -> tuple:
+    """(session_id, history, search_query) for a question
+
+    Unknown or malformed ids start a new session. A follow-up is rewritten into
+    a standalone query for the cache and retrieval, and only then does the
+    prompt get the (token-capped) history.
+    """
+    if not valid_session_id(session_id) or not sessions.enabled:
+        return str(uuid.uuid4()), [], question
+    
+    history = sessions.history(session_id)
+    search_query = rewrite_followup(question, history)
+    if search_query == question:
+        return session_id, [], question
+    
+    logger.info(f"🧵 Follow-up rewritten to: {search_query}")
+    return session_id, history_for_prompt(history), search_query
+
+def record_turn(session_id: str, question: str, search_query: str, result: dict) -> dict:
+    """Add an answered question to its session's history; returns the result tagged with the session"""
+    if result.get("method") not in ("error", "fallback", "overloaded"):
+        sessions.record(session_id, question, search_query, result.get("answer", ""))
+    
+    result = {**result, "session_id": session_id}
+    if search_query != question:
+        result["processing_info"] = {**result.get("processing_info", {}), "rewritten_query": search_query}
+    return result
+
+def run_query(question: str, trace: QueryTrace, extractive: bool = None, session_id: str = None,
+              history: list = None, search_query: str = None, filters: dict = None) -> dict:
+    """Cache lookup, retrieval and generation for one question
+
+    Generation and processing failures become fallback responses.
+    Raises Overloaded when no LLM slot frees up in time.
+    """
+    try:
+        plan = prepare_query(question, session_id or str(uuid.uuid4()), trace, extractive, history, search_query, filters)
+        if plan["response"] is not None:
+            return plan["response"]
+        
+        return answer_plan(plan, trace)
             
-            response = gemini_model.generate_content(prompt)
-            
-            # Prepare sources for frontend
-            formatted_sources = []
-            for doc in relevant_docs[:5]:
-                formatted_sources.append({
-                    "source_number": doc["source_number"],
-                    "filename": doc["metadata"].get("source", "Unknown Document"),
-                    "page_number": doc["metadata"].get("page", 0),
-                    "relevance_score": doc["relevance_score"],
-                    "text_preview": doc["content"][:200] + "...",
-                    "metadata": doc["metadata"]
-                })
-            
-            return {
-                "answer": response.text,
-                "sources": formatted_sources,
-                "session_id": session_id,
-                "method": "enhanced_rag_gemini",
-                "document_count": len(relevant_docs),
-                "processing_info": {
-                    "total_chunks_searched": len(search_results['documents'][0]) if search_results['documents'] else 0,
-                    "relevant_chunks_used": len(relevant_docs),
-                    "citation_sources": len(source_map)
-                }
-            }
-            
-        except Exception as e:
-            logger.error(f"Gemini generation failed: {e}")
-            
-            return {
-                "answer": "I'm sorry, I encountered an issue generating a response. Please try rephrasing your question or contact CSU Housing & Dining Services directly at (970) 491-5136.",
-                "sources": [{"source_number": i+1, "filename": doc["metadata"].get("source", "Unknown"), "text_preview": doc["content"][:200] + "..."} for i, doc in enumerate(relevant_docs[:3])],
-                "session_id": session_id,
-                "method": "fallback",
-                "error": str(e)
-            }
-            
+    except Overloaded:
+        raise
     except Exception as e:
         logger.error(f"Enhanced query processing failed: {e}")
-        return {
-            "answer": "I'm sorry, I encountered an error processing your question. Please try again or contact CSU Housing & Dining Services.",
-            "sources": [],
-            "session_id": str(uuid.uuid4()),
-            "method": "error",
-            "error": str(e)
-        }
+        return query_error(e)
+
+def coalesced_query(question: str, trace: QueryTrace, extractive: bool = None, session_id: str = None,
+                    filters: dict = None) -> dict:
+    """run_query, or wait for an identical question already being answered
+
+    Follow-ups are first rewritten using the session's history. Requests share
+    a computation when their normalized (rewritten) question, index version,
+    extractive setting and filters match; each still gets its own session_id.
+    Follow-ups carrying history are never shared, since their prompt includes
+    one conversation's earlier turns.
+    """
+    session_id, history, search_query = resolve_session(question, session_id)
+    compute = lambda: run_query(question, trace, extractive, session_id, history, search_query, filters)
+    started = time.perf_counter()
+    if history:
+        result, shared = compute(), False
+    else:
+        key = (normalize_question(search_query), index_version, extractive, json.dumps(filters or {}, sort_keys=True))
+        result, shared = inflight_queries.do(key, compute)
+    if shared:
+        trace.record("coalesced_wait", time.perf_counter() - started)
+        logger.info("Coalesced with an identical in-flight query")
+        result = {**result, "processing_info": {**result.get("processing_info", {}), "coalesced": True}}
+    
+    return record_turn(session_id, question, search_query, result)
+
+def query_enhanced_rag(question: str, debug: bool = False, extractive: bool = None, session_id: str = None,
+                       filters: dict = None) -> dict:
+    """Enhanced RAG query with better context and inline citations
+
+    With debug=True, processing_info carries per-stage timings_ms. extractive
+    turns the no-LLM fast path on or off (default EXTRACTIVE_ANSWERS). Passing
+    the session_id of an earlier response continues that conversation, and
+    filters (from parse_filters) limit the search to matching chunks.
+    Raises Overloaded when no LLM slot frees up in time.
+    """
+    trace = QueryTrace(stage_latency)
+    result = coalesced_query(question, trace, extractive, session_id, filters)
+    return finish_query(result, trace, "query", debug, question=question)
+
+def submit_query(question: str, debug: bool = False, extractive: bool = None, session_id: str = None,
+                 filters: dict = None):
+    """Start query_enhanced_rag on query_executor; returns its concurrent.futures.Future
+
+    The query holds an admission slot until its thread finishes, even when the
+    caller stops waiting (e.g. on timeout), so in-flight counts reflect the
+    real load. Raises Overloaded when no slot is free.
+    """
+    admission.acquire()
+    try:
+        future = query_executor.submit(query_enhanced_rag, question, debug, extractive, session_id, filters)
+    except BaseException:
+        admission.release()
+        raise
+    future.add_done_callback(lambda _: admission.release())
+    return future
+
+def stream_enhanced_rag(question: str, debug: bool = False, extractive: bool = None, session_id: str = None,
+                        filters: dict = None):
+    """Streaming variant of query_enhanced_rag
+
+    Yields (event, data) pairs: one "sources" event (with session_id and query_id)
+    as soon as retrieval is done, "token" events as Gemini produces text, then a
+    final "done" event carrying the same metadata as the non-streaming response
+    (or an "error" event).
+    """
+    session_id, history, search_query = resolve_session(question, session_id)
+    query_id = str(uuid.uuid4())
+    trace = QueryTrace(stage_latency)
+    
+    try:
+        plan = prepare_query(question, session_id, trace, extractive, history, search_query, filters)
+        
+        response = plan["response"]
+        if response is not None:
+            response = finish_query(response, trace, "stream", debug, query_id, question)
+            if response["method"] == "error":
+                yield "error", {"error": response["answer"], "session_id": session_id, "query_id": query_id, "method": "error"}
+                return
+            response = record_turn(session_id, question, search_query, response)
+            yield "sources", {"sources": response["sources"], "session_id": session_id, "query_id": query_id}
+            yield "token", {"text": response["answer"]}
+            yield "done", {key: value for key, value in response.items() if key not in ("answer", "sources")}
+            return
+        
+        yield "sources", {"sources": format_sources(plan["relevant_docs"]), "session_id": session_id, "query_id": query_id}
+        
+        answer_parts = []
+        try:
+            queued = time.perf_counter()
+            with llm_gate.slot():
+                trace.record("llm_wait", time.perf_counter() - queued)
+                with trace.span("generate"):
+                    stream = gemini_model.generate_content(
+                        plan["prompt"],
+                        stream=True,
+                        request_options={"timeout": LLM_TIMEOUT_SECONDS}
+                    )
+                    for chunk in stream:
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            continue  # Chunks without text parts (e.g. safety metadata)
+                        if text:
+                            trace.mark("first_token")
+                            answer_parts.append(text)
+                            yield "token", {"text": text}
+        except Overloaded as e:
+            llm_errors.inc(kind="overloaded")
+            yield "error", {"error": str(e), "session_id": session_id, "query_id": query_id, "method": "overloaded", "retry_after": e.retry_after}
+            return
+        except Exception as e:
+            logger.error(f"Gemini streaming failed: {e}")
+            llm_errors.inc(kind=llm_error_kind(e))
+            fallback = finish_query(generation_fallback(plan["relevant_docs"], session_id, e), trace, "stream", query_id=query_id)
+            yield "error", {"error": fallback["error"], "answer": fallback["answer"], "session_id": session_id, "query_id": query_id, "method": "fallback"}
+            return
+        
+        result = finish_query(complete_query(plan, "".join(answer_parts)), trace, "stream", debug, query_id, question)
+        result = record_turn(session_id, question, search_query, result)
+        yield "done", {key: value for key, value in result.items() if key not in ("answer", "sources")}
+        
+    except Exception as e:
+        logger.error(f"Enhanced streaming query failed: {e}")
+        finish_query(query_error(e), trace, "stream", query_id=query_id)
+        yield "error", {"error": str(e), "session_id": session_id, "query_id": query_id, "method": "error"}
+
+def batch_query(questions: list, extractive: bool = None, debug: bool = False,
+                workers: int = BATCH_GENERATION_WORKERS):
+    """Answer many questions, yielding (index, result) pairs as each one finishes
+
+    Repeated questions are answered once and exact cache hits are answered first.
+    The rest are embedded in one vectorized call, checked against the semantic
+    cache and searched with one multi-query Chroma call per routed scope; the
+    remaining generations run on at most `workers` threads, each still taking
+    an LLM slot, so a batch can't starve interactive queries.
+    Answers are cached, so a batch also pre-warms /api/query.
+    """
+    traces = [QueryTrace(stage_latency) for _ in questions]
+    session_ids = [str(uuid.uuid4()) for _ in questions]
+    
+    # Repeats of a question within the batch are answered once
+    cache_keys = [normalize_question(question) for question in questions]
+    first_index = {}
+    repeats = {}
+    for i, cache_key in enumerate(cache_keys):
+        if cache_key in first_index:
+            repeats.setdefault(first_index[cache_key], []).append(i)
+        else:
+            first_index[cache_key] = i
+    
+    def finish(i, result):
+        yield i, finish_query(result, traces[i], "batch", debug, question=questions[i])
+        for j in repeats.get(i, []):
+            repeat = {**result, "session_id": session_ids[j], "processing_info": {**result.get("processing_info", {}), "coalesced": True}}
+            yield j, finish_query(repeat, traces[j], "batch", debug, question=questions[j])
+    
+    def share(stage, started, indices):
+        # One call served several questions; give each its share of the time
+        seconds = (time.perf_counter() - started) / max(1, len(indices))
+        for i in indices:
+            traces[i].record(stage, seconds)
+    
+    if not chroma_collection or not gemini_model or not embedding_engine:
+        for i in first_index.values():
+            yield from finish(i, not_initialized_response(session_ids[i]))
+        return
+    
+    pending = []
+    for i in first_index.values():
+        with traces[i].span("cache_lookup"):
+            cached = answer_cache.get_exact(cache_keys[i])
+        if cached is not None:
+            cache_lookups.inc(result="exact")
+            yield from finish(i, cached_response(cached, "exact", session_ids[i]))
+        else:
+            pending.append(i)
+    if not pending:
+        return
+    
+    started = time.perf_counter()
+    embeddings = embed_queries([questions[i] for i in pending])
+    share("embed", started, pending)
+    
+    to_search = []
+    for i, query_embedding in zip(pending, embeddings):
+        with traces[i].span("cache_lookup"):
+            cached = answer_cache.get_similar(query_embedding)
+        if cached is not None:
+            cache_lookups.inc(result="semantic")
+            yield from finish(i, cached_response(cached, "semantic", session_ids[i]))
+        else:
+            cache_lookups.inc(result="miss" if answer_cache.enabled else "disabled")
+            to_search.append((i, query_embedding))
+    if not to_search:
+        return
+    
+    started = time.perf_counter()
+    routes = [resolve_route(questions[i]) for i, _ in to_search]
+    retrieved = retrieve_relevant_docs_batch([questions[i] for i, _ in to_search], [embedding for _, embedding in to_search], routes)
+    share("search", started, [i for i, _ in to_search])
+    
+    plans = {}
+    for (i, query_embedding), route, (relevant_docs, total_searched) in zip(to_search, routes, retrieved):
+        try:
+            plan = plan_query(questions[i], session_ids[i], traces[i], cache_keys[i], query_embedding,
+                              relevant_docs, total_searched, extractive, route=route)
+        except Exception as e:
+            logger.error(f"Batch query planning failed: {e}")
+            yield from finish(i, query_error(e))
+            continue
+        if plan["response"] is not None:
+            yield from finish(i, plan["response"])
+        else:
+            plans[i] = plan
+    
+    def generate(i):
+        try:
+            return answer_plan(plans[i], traces[i])
+        except Overloaded as e:
+            return {**query_error(e), "session_id": session_ids[i], "method": "overloaded", "retry_after": e.retry_after}
+    
+    pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="rabuddy-batch")
+    try:
+        futures = {pool.submit(generate, i): i for i in plans}
+        for future in as_completed(futures):
+            yield from finish(futures[future], future.result())
+    finally:
+        # A disconnected client stops the batch: drop generations that haven't started
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def not_ready_response():
+    """503 while components are still warming up"""
+    response = jsonify({
+        "error": "RABuddy is still starting up",
+        "readiness": warmup.snapshot(),
+        "session_id": str(uuid.uuid4())
+    })
+    response.status_code = 503
+    response.headers["Retry-After"] = "5"
+    return response
+
+def overloaded_response(e: Overloaded):
+    """429 response telling the client when to retry"""
+    response = jsonify({
+        "error": "Server is busy",
+        "message": str(e),
+        "retry_after": e.retry_after,
+        "session_id": str(uuid.uuid4())
+    })
+    response.status_code = 429
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+def debug_requested(data: dict) -> bool:
+    """Per-request timings: {"debug": true} in the body or ?debug=1"""
+    return bool(data.get('debug')) or request.args.get('debug') == '1'
+
+def extractive_requested(data: dict):
+    """Per-request override of EXTRACTIVE_ANSWERS via {"extractive": true|false}"""
+    value = data.get('extractive')
+    return None if value is None else bool(value)
+
+def filters_requested(data: dict) -> dict:
+    """Search filters from {"filters": {"source" | "doc_type" | "topic": value or [values]}}
+
+    Raises ValueError (a 400) for malformed filters or values not in the index.
+    """
+    return parse_filters(data.get('filters'), index_catalog)
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 # Routes
 @app.route('/')
@@ -381,7 +1462,7 @@ def health_check():
         "rag_status": {
             "chromadb": chroma_collection is not None,
             "gemini": gemini_model is not None,
-            "embeddings": embedding_model is not None,
+            "embeddings": embedding_engine is not None,
             "documents": doc_count,
             "collection": collection_name
         },
@@ -395,7 +1476,15 @@ def health_check():
 
 @app.route('/api/query', methods=['POST', 'OPTIONS'])
 def api_query():
-    """Enhanced RAG query endpoint"""
+    """Enhanced RAG query endpoint
+
+    A plain WSGI view: under gunicorn's gthread workers every request holds a
+    server thread until it returns, so concurrency per worker is bounded by
+    GUNICORN_THREADS, and admission (sized from it) answers 429 with
+    Retry-After once the query slots are taken. The query itself runs on
+    query_executor so the view can return 504 after REQUEST_TIMEOUT_SECONDS
+    while the query thread finishes in the background.
+    """
     if request.method == 'OPTIONS':
         return jsonify({'message': 'CORS preflight OK'})
     
@@ -406,11 +1495,31 @@ def api_query():
         if not question:
             return jsonify({"error": "Question is required"}), 400
         
+        if not warmup.is_ready():
+            return not_ready_response()
+        
+        try:
+            filters = filters_requested(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
         logger.info(f"Processing enhanced query: {question[:100]}...")
-        result = query_enhanced_rag(question)
+        future = submit_query(question, debug_requested(data), extractive_requested(data),
+                              data.get('session_id'), filters)
+        result = future.result(timeout=REQUEST_TIMEOUT_SECONDS)
         
         return jsonify(result)
         
+    except Overloaded as e:
+        logger.warning(f"Rejecting query: {e}")
+        return overloaded_response(e)
+    except FuturesTimeout:
+        logger.error(f"Query timed out after {REQUEST_TIMEOUT_SECONDS}s")
+        return jsonify({
+            "error": "Query timed out",
+            "message": f"No answer within {REQUEST_TIMEOUT_SECONDS:.0f} seconds, please try again",
+            "session_id": str(uuid.uuid4())
+        }), 504
     except Exception as e:
         logger.error(f"API query failed: {e}")
         return jsonify({
@@ -419,9 +1528,186 @@ def api_query():
             "session_id": str(uuid.uuid4())
         }), 500
 
+@app.route('/api/query/stream', methods=['POST', 'OPTIONS'])
+def api_query_stream():
+    """Streaming RAG query endpoint (Server-Sent Events)
+
+    Sends the retrieved sources immediately, then answer tokens as Gemini
+    generates them. /api/query keeps its non-streaming contract.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'message': 'CORS preflight OK'})
+    
+    data = request.get_json(silent=True) or {}
+    question = data.get('question', '').strip()
+    
+    if not question:
+        return jsonify({"error": "Question is required"}), 400
+    
+    if not warmup.is_ready():
+        return not_ready_response()
+    
+    try:
+        filters = filters_requested(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    logger.info(f"Processing streaming query: {question[:100]}...")
+    
+    # The admission slot is held until the stream finishes
+    try:
+        admission.acquire()
+    except Overloaded as e:
+        logger.warning(f"Rejecting streaming query: {e}")
+        return overloaded_response(e)
+    
+    debug = debug_requested(data)
+    extractive = extractive_requested(data)
+    session_id = data.get('session_id')
+    
+    def generate():
+        try:
+            for event, payload in stream_enhanced_rag(question, debug, extractive, session_id, filters):
+                yield sse_event(event, payload)
+        finally:
+            admission.release()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Don't let proxies buffer the stream
+        }
+    )
+
+@app.route('/api/query/batch', methods=['POST', 'OPTIONS'])
+def api_query_batch():
+    """Batch query endpoint for bulk evaluation and cache pre-warming
+
+    Takes {"questions": [...]} and streams one JSON object per line as answers
+    finish (not in request order; each carries its "index" and "question").
+    Holds a single admission slot for the whole batch.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'message': 'CORS preflight OK'})
+    
+    data = request.get_json(silent=True) or {}
+    questions = data.get('questions')
+    
+    if not isinstance(questions, list) or not questions:
+        return jsonify({"error": "questions must be a non-empty list"}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({"error": f"At most {BATCH_MAX_QUESTIONS} questions per batch"}), 400
+    if not all(isinstance(question, str) and question.strip() for question in questions):
+        return jsonify({"error": "Every question must be a non-empty string"}), 400
+    questions = [question.strip() for question in questions]
+    
+    if not warmup.is_ready():
+        return not_ready_response()
+    
+    logger.info(f"Processing batch of {len(questions)} questions")
+    
+    try:
+        admission.acquire()
+    except Overloaded as e:
+        logger.warning(f"Rejecting batch query: {e}")
+        return overloaded_response(e)
+    
+    debug = debug_requested(data)
+    extractive = extractive_requested(data)
+    
+    def generate():
+        try:
+            for i, result in batch_query(questions, extractive, debug):
+                yield json.dumps({"index": i, "question": questions[i], **result}) + "\n"
+        except Exception as e:
+            logger.error(f"Batch query failed: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+        finally:
+            admission.release()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@app.route('/api/feedback', methods=['POST', 'OPTIONS'])
+def api_feedback():
+    """Record a thumbs up/down on an answer
+
+    Takes {"query_id": ..., "feedback_type": "positive" | "negative"} plus an
+    optional "comment". The record is queued for the background writer and the
+    request returns 202 without touching the disk.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'message': 'CORS preflight OK'})
+    
+    data = request.get_json(silent=True) or {}
+    query_id = data.get('query_id')
+    feedback_type = data.get('feedback_type')
+    
+    if not isinstance(query_id, str) or not query_id.strip() or len(query_id) > 128:
+        return jsonify({"error": "query_id is required"}), 400
+    if feedback_type not in FEEDBACK_TYPES:
+        return jsonify({"error": f"feedback_type must be one of: {', '.join(FEEDBACK_TYPES)}"}), 400
+    comment = data.get('comment')
+    
+    record = {
+        "kind": "feedback",
+        "query_id": query_id,
+        "feedback_type": feedback_type,
+        "timestamp": datetime.now().isoformat(),
+        "index_version": index_version,
+        **(recent_queries.get(query_id) or {})
+    }
+    if isinstance(comment, str) and comment.strip():
+        record["comment"] = comment.strip()[:1000]
+    
+    if not feedback_log.submit(record):
+        logger.warning("Feedback queue full, dropping feedback")
+        return jsonify({"error": "Feedback queue is full, please try again shortly"}), 503
+    
+    feedback_total.inc(type=feedback_type)
+    return jsonify({"status": "queued", "query_id": query_id, "matched_query": "question" in record}), 202
+
+@app.route('/api/feedback/summary')
+def api_feedback_summary():
+    """Questions and source pages ranked by negative feedback (?limit=20)
+
+    Use it to find answers worth pre-caching or rewording, and chunks worth fixing.
+    """
+    try:
+        limit = max(1, int(request.args.get('limit', 20)))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    
+    feedback_log.flush()
+    return jsonify({**feedback_summary.summary(limit), "log": feedback_log.stats()})
+
+@app.route('/api/sources')
+def api_sources():
+    """Chunk counts per source PDF, doc_type and topic in the served index: the values filters accept"""
+    return jsonify({**index_catalog, "routing": QUERY_ROUTING, "index_version": index_version})
+
+@app.route('/api/ready')
+def api_ready():
+    """Readiness: 200 once every component is warm, 503 with per-component progress before that
+
+    Also switches to a newly swapped-in index version if another process built one.
+    """
+    snapshot = warmup.snapshot()
+    if snapshot["ready"]:
+        refresh_index()
+    return jsonify(snapshot), 200 if snapshot["ready"] else 503
+
 @app.route('/api/health')
 def api_health():
-    """Enhanced health endpoint"""
+    """Liveness: cheap, never touches the index or the LLM"""
     return jsonify({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
@@ -429,23 +1715,49 @@ def api_health():
         "components": {
             "chromadb": chroma_collection is not None,
             "gemini": gemini_model is not None,
-            "embeddings": embedding_model is not None,
+            "embeddings": embedding_engine is not None,
             "environment": {
                 "gemini_api_key": bool(os.getenv('GEMINI_API_KEY'))
             }
-        }
+        },
+        "answer_cache": answer_cache.stats(),
+        "concurrency": {
+            "requests": admission.stats(),
+            "llm": llm_gate.stats(),
+            "coalescing": inflight_queries.stats()
+        },
+        "index": {
+            "collection": chroma_collection.name if chroma_collection else None,
+            "version": index_version,
+            "rebuild": rebuild_jobs.stats()
+        },
+        "sessions": sessions.stats(),
+        "feedback": feedback_log.stats(),
+        "query_embedding_cache": query_embeddings.stats(),
+        "routing": {"enabled": QUERY_ROUTING, "topics": len(index_catalog.get("topics", {}))}
     })
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint: stage latency histograms, counters and gauges for this process"""
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.route('/api/debug')
 def api_debug():
-    """Enhanced debug endpoint"""
-    if not chroma_collection:
+    """Enhanced debug endpoint
+
+    With ?source=<pdf name>&page=<n> returns that page's stored text (no PDF parsing).
+    """
+    if request.args.get('source'):
+        return debug_page_text(request.args['source'], request.args.get('page', '1'))
+    
+    if not chroma_collection or not embedding_engine:
         return jsonify({"error": "ChromaDB not initialized"}), 500
     
     try:
         # Get sample documents with metadata
         sample_results = chroma_collection.query(
-            query_texts=["housing policy"],
+            query_embeddings=[embed_query("housing policy")],
             n_results=5,
             include=['documents', 'metadatas']
         )
@@ -461,39 +1773,101 @@ def api_debug():
                 }
                 for i, doc in enumerate(sample_results['documents'][0])
             ] if sample_results['documents'] else [],
+            "chunking": {
+                "params": CHUNKING_PARAMS,
+                "length_histogram": histogram_buckets(manifest_chunk_histogram(load_manifest(active_index_dir(), ingest_params())))
+            },
             "version": "enhanced_v2.0"
         })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def debug_page_text(source: str, page: str):
+    """Serve one page's extracted text from the page-text store"""
+    try:
+        page_number = int(page)
+    except ValueError:
+        return jsonify({"error": "page must be an integer"}), 400
+    
+    entry = load_manifest(active_index_dir(), ingest_params())["files"].get(source)
+    if entry is None or not page_store.has(entry["sha256"]):
+        return jsonify({"error": f"No stored page text for {source}"}), 404
+    
+    try:
+        text = page_store.page_text(entry["sha256"], page_number - 1)
+    except IndexError:
+        return jsonify({"error": f"{source} has {entry.get('total_pages')} pages"}), 404
+    
+    return jsonify({
+        "source": source,
+        "page": page_number,
+        "total_pages": entry.get("total_pages"),
+        "sha256": entry["sha256"],
+        "text": text
+    })
+
+def run_rebuild(job):
+    """Rebuild job: build a new index version, then swap it in for this process's queries
+
+    Pre-forked workers build in a spawned process (so model inference stays
+    out of the serving process); the other workers switch to the new version
+    on their next refresh_index().
+    """
+    if read_only_index:
+        success, doc_count = build_in_subprocess(job)
+    else:
+        success, doc_count = process_pdfs_enhanced(force=job.force, progress=job.update)
+    if not success:
+        raise RuntimeError("Index build failed; the previous index is still serving")
+    
+    job.update(phase="connecting")
+    if not connect_chromadb():
+        raise RuntimeError("The new index could not be opened; this process still serves the previous one")
+    
+    job.update(phase="done")
+    return {
+        "document_count": doc_count,
+        "collection": chroma_collection.name,
+        "index_version": index_version
+    }
+
 @app.route('/api/rebuild', methods=['POST'])
 def rebuild_database():
-    """Rebuild the vector database"""
+    """Start a background rebuild of the vector database
+
+    Only changed PDFs are re-embedded; send {"force": true} to rebuild from scratch.
+    The current index keeps answering queries until the new version is swapped in.
+    Returns 202 with the job; poll GET /api/rebuild/<job_id>. A request matching
+    the running job joins it, a conflicting one gets 409. Jobs are per worker;
+    builds started on different workers run one after the other.
+    """
+    data = request.get_json(silent=True) or {}
+    force = bool(data.get('force', False))
+    
     try:
-        logger.info("🔄 Rebuilding vector database...")
-        success = initialize_enhanced_rag()
-        
-        if success:
-            return jsonify({
-                "message": "Vector database rebuilt successfully",
-                "document_count": chroma_collection.count() if chroma_collection else 0,
-                "timestamp": datetime.now().isoformat()
-            })
-        else:
-            return jsonify({"error": "Failed to rebuild database"}), 500
-            
-    except Exception as e:
-        logger.error(f"Database rebuild failed: {e}")
-        return jsonify({"error": str(e)}), 500
+        job, merged = rebuild_jobs.submit(run_rebuild, force=force)
+    except RebuildInProgress as e:
+        return jsonify({"error": str(e), "job": e.job.to_dict()}), 409
+    
+    logger.info(f"🔄 Rebuild {job.id} {'joined' if merged else 'queued'} (force={force})")
+    return jsonify({
+        "job": job.to_dict(),
+        "merged": merged,
+        "status_url": f"/api/rebuild/{job.id}"
+    }), 202
+
+@app.route('/api/rebuild/<job_id>', methods=['GET'])
+def rebuild_status(job_id):
+    """Status and progress of a rebuild job ("latest" for the most recent one)"""
+    job = rebuild_jobs.latest() if job_id == "latest" else rebuild_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown rebuild job: {job_id}"}), 404
+    return jsonify(job.to_dict())
 
 if __name__ == '__main__':
-    # Initialize enhanced RAG system
-    rag_ready = initialize_enhanced_rag()
-    
-    if not rag_ready:
-        logger.error("❌ Enhanced RAG system failed to initialize")
-        exit(1)
+    # Bind right away; components warm up in the background (see /api/ready)
+    start_background_warmup()
     
     # Start Flask server
     port = int(os.environ.get('PORT', 5001))
@@ -503,5 +1877,6 @@ if __name__ == '__main__':
         host='0.0.0.0',
         port=port,
         debug=True,
-        threaded=True
+        threaded=True,
+        use_reloader=False  # the reloader would run warm-up twice
     )
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+RABuddy Extractive Answers
+Answers plain lookups straight from the best retrieved chunk when retrieval is confident, skipping Gemini
+"""
+
+import os
+
+from context_builder import select_sentences
+
+EXTRACTIVE_ANSWERS = os.getenv('EXTRACTIVE_ANSWERS', 'false').lower() == 'true'
+EXTRACTIVE_MIN_SCORE = float(os.getenv('EXTRACTIVE_MIN_SCORE', 0.55))
+EXTRACTIVE_MIN_MARGIN = float(os.getenv('EXTRACTIVE_MIN_MARGIN', 0.1))
+EXTRACTIVE_MAX_TOKENS = int(os.getenv('EXTRACTIVE_MAX_TOKENS', 80))
+
+
+def answer_confidence(docs: list) -> tuple:
+    """(top_score, margin) for the top-ranked chunk
+
+    The margin is the top chunk's relevance score minus the best score among
+    the other chunks, so a close runner-up (an ambiguous question) or a fused
+    ranking that disagrees with the vector scores gives a small or negative margin.
+    """
+    if not docs:
+        return 0.0, 0.0
+    top_score = docs[0]["relevance_score"]
+    runner_up = max((doc["relevance_score"] for doc in docs[1:]), default=0.0)
+    return top_score, top_score - runner_up
+
+
+def extractive_answer(question: str, docs: list, min_score: float = EXTRACTIVE_MIN_SCORE,
+                      min_margin: float = EXTRACTIVE_MIN_MARGIN,
+                      max_tokens: int = EXTRACTIVE_MAX_TOKENS) -> tuple:
+    """Quote the most relevant sentences of the top chunk when confidence is high enough
+
+    docs are the context docs in rank order (already deduplicated, so the same
+    passage found in two PDFs doesn't count as a competing answer).
+    Returns (answer or None, info) where info records the scores and decision.
+    """
+    top_score, margin = answer_confidence(docs)
+    info = {
+        "top_score": round(top_score, 3),
+        "margin": round(margin, 3),
+        "min_score": min_score,
+        "min_margin": min_margin
+    }
+    if not docs or top_score < min_score or margin < min_margin:
+        info["used"] = False
+        return None, info
+
+    best = docs[0]
+    excerpt = select_sentences(question, best["content"], max_tokens).strip()
+    source = best["metadata"].get("source", "Unknown Document")
+    page = best["metadata"].get("page", "Unknown")
+
+    info["used"] = True
+    answer = f'According to {source} (Page {page}): "{excerpt}" (Source {best["source_number"]})'
+    return answer, info
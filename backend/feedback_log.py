@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+RABuddy Feedback Log
+Thumbs up/down queued in memory and group-committed to an append-only JSON Lines file by a background writer
+"""
+
+import atexit
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from answer_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_LOG_PATH = Path(os.getenv('FEEDBACK_LOG_PATH', Path(__file__).parent / "feedback" / "feedback.jsonl"))
+FEEDBACK_QUEUE_SIZE = int(os.getenv('FEEDBACK_QUEUE_SIZE', 10000))
+FEEDBACK_BATCH_SIZE = int(os.getenv('FEEDBACK_BATCH_SIZE', 500))
+FEEDBACK_FLUSH_SECONDS = float(os.getenv('FEEDBACK_FLUSH_SECONDS', 1.0))
+FEEDBACK_QUERY_MEMORY = int(os.getenv('FEEDBACK_QUERY_MEMORY', 5000))
+FEEDBACK_LOG_QUERIES = os.getenv('FEEDBACK_LOG_QUERIES', 'false').lower() == 'true'
+FEEDBACK_LOG_MAX_BYTES = int(os.getenv('FEEDBACK_LOG_MAX_BYTES', 20 * 1024 * 1024))
+FEEDBACK_LOG_BACKUPS = int(os.getenv('FEEDBACK_LOG_BACKUPS', 3))
+FEEDBACK_TYPES = ("positive", "negative")
+
+
+def query_context(question: str, result: dict) -> dict:
+    """What feedback on an answer should be attributed to: the question, method and cited pages"""
+    return {
+        "question": question,
+        "method": result.get("method"),
+        "session_id": result.get("session_id"),
+        "sources": [
+            {"filename": source.get("filename"), "page_number": source.get("page_number")}
+            for source in result.get("sources", [])
+        ]
+    }
+
+
+class QueryRegistry:
+    """Bounded map of recent query_id -> question and sources, so feedback can say what it was about"""
+
+    def __init__(self, max_entries: int = FEEDBACK_QUERY_MEMORY):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def remember(self, query_id: str, question: str, result: dict) -> dict:
+        entry = query_context(question, result)
+        with self._lock:
+            self._entries[query_id] = entry
+            self._entries.move_to_end(query_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def get(self, query_id: str) -> dict:
+        with self._lock:
+            return self._entries.get(query_id)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class FeedbackLog:
+    """Append-only feedback store with a group-committing writer thread
+
+    submit() only enqueues, so requests never wait on disk. The writer drains
+    whatever has queued up (at most batch_size records) and appends it with one
+    write and one fsync. Each batch goes out as a single O_APPEND write, so
+    several gunicorn workers can share the file without interleaving lines.
+    Records are votes ("kind": "feedback") or, when FEEDBACK_LOG_QUERIES is on,
+    the answered queries they refer to ("kind": "query"). Once the file passes
+    max_bytes it is rotated to .1, .2, ... and only the newest backups are kept.
+    """
+
+    def __init__(self, path: Path = FEEDBACK_LOG_PATH, queue_size: int = FEEDBACK_QUEUE_SIZE,
+                 batch_size: int = FEEDBACK_BATCH_SIZE, flush_seconds: float = FEEDBACK_FLUSH_SECONDS,
+                 max_bytes: int = FEEDBACK_LOG_MAX_BYTES, backups: int = FEEDBACK_LOG_BACKUPS):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"accepted": 0, "dropped": 0, "written": 0, "batches": 0, "write_errors": 0, "largest_batch": 0,
+                       "rotations": 0}
+        atexit.register(self.flush)
+
+    def _ensure_writer(self):
+        # Started lazily so each pre-forked worker gets its own writer thread
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="rabuddy-feedback-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, record: dict) -> bool:
+        """Queue a record for writing; False if the queue is full"""
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped"] += 1
+            return False
+        with self._lock:
+            self._stats["accepted"] += 1
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_seconds)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: list):
+        data = "".join(json.dumps(record) + "\n" for record in batch).encode('utf-8')
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                os.fsync(fd)
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+            if self.max_bytes > 0 and size > self.max_bytes:
+                self._rotate()
+        except OSError as e:
+            logger.error(f"💥 Failed to write {len(batch)} feedback records: {e}")
+            with self._lock:
+                self._stats["write_errors"] += 1
+            return
+
+        with self._lock:
+            self._stats["written"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+
+    def backup_path(self, number: int) -> Path:
+        return self.path.with_name(f"{self.path.name}.{number}")
+
+    def _rotate(self):
+        """Shift feedback.jsonl -> .1 -> .2 ..., dropping the oldest; locked, since every worker writes here"""
+        lock_fd = os.open(self.path.with_name(f".{self.path.name}.lock"), os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            try:
+                if self.path.stat().st_size <= self.max_bytes:
+                    return  # another worker rotated it first
+            except FileNotFoundError:
+                return
+            self.backup_path(self.backups).unlink(missing_ok=True)
+            for number in range(self.backups - 1, 0, -1):
+                if self.backup_path(number).exists():
+                    os.replace(self.backup_path(number), self.backup_path(number + 1))
+            if self.backups > 0:
+                os.replace(self.path, self.backup_path(1))
+            else:
+                self.path.unlink()
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+        with self._lock:
+            self._stats["rotations"] += 1
+        logger.info(f"🔄 Rotated feedback log {self.path}")
+
+    def flush(self, timeout: float = 5.0):
+        """Wait (up to timeout) until everything queued so far is on disk"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            if self._thread is None or not self._thread.is_alive():
+                return
+            time.sleep(0.01)
+
+    def files(self) -> list:
+        """Backups (oldest first) and the current file"""
+        return [self.backup_path(number) for number in range(self.backups, 0, -1)] + [self.path]
+
+    def read(self):
+        """Every record still kept, oldest first (unreadable lines are skipped)"""
+        for path in self.files():
+            try:
+                with open(path) as f:
+                    for line in f:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+            except FileNotFoundError:
+                continue
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "queued": self._queue.qsize(), "path": str(self.path)}
+
+
+def collect_feedback(records, latest: dict, queries: dict):
+    """Fold log records into the latest vote per query_id and the logged query records"""
+    for record in records:
+        if record.get("kind") == "query":
+            queries[record.get("query_id")] = record
+        elif record.get("feedback_type") in FEEDBACK_TYPES:
+            latest[record.get("query_id")] = record
+
+
+def parse_lines(data: bytes):
+    for line in data.splitlines():
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue
+
+
+class FeedbackSummary:
+    """Incremental view of the log for /api/feedback/summary
+
+    Keeps the latest vote per query_id (and logged query records) in memory and
+    on each call parses only the lines appended since the last one. After a
+    rotation the kept files are re-read, which is bounded by the rotation size.
+    """
+
+    def __init__(self, log: FeedbackLog):
+        self.log = log
+        self._latest = {}
+        self._queries = {}
+        self._inode = None
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        with self._lock:
+            try:
+                f = open(self.log.path, 'rb')
+            except FileNotFoundError:
+                f = None  # just rotated, nothing written since
+            inode = os.fstat(f.fileno()).st_ino if f is not None else None
+            if inode != self._inode or f is None:
+                # New or rotated file: rebuild from the backups, then read this one from the start
+                self._latest, self._queries, self._offset = {}, {}, 0
+                for path in self.log.files()[:-1]:
+                    try:
+                        collect_feedback(parse_lines(path.read_bytes()), self._latest, self._queries)
+                    except FileNotFoundError:
+                        continue
+                self._inode = inode
+            if f is None:
+                return
+            with f:
+                f.seek(self._offset)
+                data = f.read()
+            end = data.rfind(b"\n") + 1  # a batch still being written is read next time
+            collect_feedback(parse_lines(data[:end]), self._latest, self._queries)
+            self._offset += end
+
+    def summary(self, limit: int = 20) -> dict:
+        self.refresh()
+        with self._lock:
+            return rank_feedback(self._latest, self._queries, limit)
+
+
+def summarize_feedback(records, limit: int = 20) -> dict:
+    """Questions and source pages ranked by negative feedback, from an iterable of log records"""
+    latest, queries = {}, {}
+    collect_feedback(records, latest, queries)
+    return rank_feedback(latest, queries, limit)
+
+
+def rank_feedback(latest: dict, queries: dict, limit: int = 20) -> dict:
+    """Questions and source pages ranked by negative feedback
+
+    The last vote per query_id counts, so changing a thumbs-up to a
+    thumbs-down isn't double counted. Votes recorded by a worker that didn't
+    answer the query get its question and sources from the logged query record.
+    """
+    questions = {}
+    sources = {}
+    totals = {feedback_type: 0 for feedback_type in FEEDBACK_TYPES}
+    unattributed = 0
+    for query_id, record in latest.items():
+        logged = queries.get(query_id)
+        if not record.get("question") and logged:
+            record = {**record, "question": logged.get("question"), "sources": logged.get("sources")}
+        if not record.get("question"):
+            unattributed += 1
+        feedback_type = record["feedback_type"]
+        totals[feedback_type] += 1
+
+        question = record.get("question")
+        if question:
+            entry = questions.setdefault(normalize_question(question), {"question": question, "positive": 0, "negative": 0})
+            entry[feedback_type] += 1
+            entry["question"] = question
+
+        for source in record.get("sources") or []:
+            key = (source.get("filename"), source.get("page_number"))
+            entry = sources.setdefault(key, {"filename": key[0], "page_number": key[1], "positive": 0, "negative": 0})
+            entry[feedback_type] += 1
+
+    def ranked(entries):
+        for entry in entries:
+            entry["negative_rate"] = round(entry["negative"] / (entry["positive"] + entry["negative"]), 3)
+        entries = [entry for entry in entries if entry["negative"]]
+        return sorted(entries, key=lambda e: (-e["negative"], -e["negative_rate"]))[:limit]
+
+    return {
+        "totals": totals,
+        "unattributed": unattributed,
+        "questions": ranked(list(questions.values())),
+        "sources": ranked(list(sources.values()))
+    }
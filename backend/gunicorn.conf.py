@@ -0,0 +1,50 @@
+"""
+RABuddy gunicorn configuration
+Usage (from backend/): gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import logging
+import os
+import time
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5001)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = "gthread"
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Import wsgi.py once in the master: the index is built a single time (in the
+# background) and the embedding model is loaded before fork, so workers share its memory.
+preload_app = True
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+logger = logging.getLogger("gunicorn.error")
+
+
+def post_fork(server, worker):
+    """Warm each worker in the background so it starts accepting immediately
+
+    ChromaDB's SQLite handles and Gemini's gRPC channels are not fork-safe,
+    so they are created after fork rather than inherited from the master.
+    Until warm-up finishes the worker answers /api/ready with 503.
+    """
+    import enhanced_app
+    from wsgi import current_rss_mb, wait_for_index
+
+    started = time.perf_counter()
+
+    def on_done(success):
+        if success:
+            logger.info(f"👷 Worker {worker.pid} ready in {time.perf_counter() - started:.2f}s, RSS {current_rss_mb():.0f} MB")
+        else:
+            logger.error(f"❌ Worker {worker.pid} failed to warm up, see /api/ready")
+
+    enhanced_app.start_background_warmup(
+        target=lambda: enhanced_app.initialize_worker(wait_for_index=wait_for_index),
+        on_done=on_done
+    )
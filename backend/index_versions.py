@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+RABuddy Index Versions
+Each rebuild writes a new versioned collection; a pointer file says which one is served
+"""
+
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+ACTIVE_INDEX_FILENAME = "active_index.json"
+BUILD_LOCK_FILENAME = ".build.lock"
+INDEX_VERSIONS_DIRNAME = "indexes"
+
+
+def new_collection_name(base_name: str) -> str:
+    """Unique, sortable name for the next index version"""
+    return f"{base_name}_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+
+
+def index_dir(store_path: Path, collection_name: str, base_name: str) -> Path:
+    """Directory holding a version's manifest and BM25 index
+
+    The unversioned base collection predates versioning and keeps its files in
+    the store root, so existing stores are reused instead of re-embedded.
+    """
+    if collection_name == base_name:
+        return Path(store_path)
+    return Path(store_path) / INDEX_VERSIONS_DIRNAME / collection_name
+
+
+def read_active_index(store_path: Path) -> dict:
+    """The pointer to the served collection, or None if no versioned index was ever swapped in"""
+    try:
+        with open(Path(store_path) / ACTIVE_INDEX_FILENAME) as f:
+            pointer = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return pointer if pointer.get("collection") else None
+
+
+def write_active_index(store_path: Path, collection_name: str, previous: str = None):
+    """Swap the served collection by atomically replacing the pointer file"""
+    pointer_path = Path(store_path) / ACTIVE_INDEX_FILENAME
+    tmp_path = pointer_path.with_suffix(".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            "collection": collection_name,
+            "previous": previous,
+            "swapped_at": datetime.now().isoformat()
+        }, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, pointer_path)
+
+
+@contextmanager
+def build_lock(store_path: Path):
+    """Exclusive lock on the store for one index build across processes (gunicorn workers each start their own builder)"""
+    Path(store_path).mkdir(parents=True, exist_ok=True)
+    fd = os.open(Path(store_path) / BUILD_LOCK_FILENAME, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+RABuddy Streaming Ingest Pipeline
+Extract pages across a process pool -> yield chunks -> embed and write in bounded batches
+"""
+
+import logging
+import multiprocessing
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+
+from chunking import chunk_text_spans
+from routing import document_type, metadata_topics, topic_metadata
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 0))  # 0 = one per CPU core
+INGEST_PAGES_PER_TASK = int(os.getenv('INGEST_PAGES_PER_TASK', 8))
+INGEST_WRITE_BATCH_SIZE = int(os.getenv('INGEST_WRITE_BATCH_SIZE', 256))
+
+
+def count_pages(pdf_path: Path) -> int:
+    """Read a PDF's page count without extracting any text"""
+    from PyPDF2 import PdfReader
+
+    with open(pdf_path, 'rb') as file:
+        return len(PdfReader(file).pages)
+
+
+def chunk_page_text(pdf_path: Path, page_num: int, text: str, total_pages: int, params: dict) -> list:
+    """Split one page with the configured chunker into (id, document, metadata) tuples"""
+    chunks = []
+    if not text or not text.strip():
+        return chunks
+
+    doc_type = document_type(pdf_path.name)
+    for chunk_id, (start, end, chunk_text, section) in enumerate(chunk_text_spans(text, params), start=1):
+        metadata = {
+            "source": pdf_path.name,
+            "page": page_num + 1,
+            "chunk_id": chunk_id,
+            "doc_type": doc_type,
+            "total_pages": total_pages,
+            "char_start": start,
+            "char_end": end,
+            "chunker": params["strategy"],
+            **topic_metadata(chunk_text)
+        }
+        if section:
+            metadata["section"] = section  # ChromaDB metadata can't hold None
+        chunks.append((f"{pdf_path.stem}_page_{page_num + 1}_chunk_{chunk_id}", chunk_text, metadata))
+
+    return chunks
+
+
+def extract_page_range(pdf_path: str, start: int, end: int, total_pages: int, params: dict) -> tuple:
+    """Worker task: extract and chunk pages [start, end) of one PDF; returns (page_texts, chunks)"""
+    from PyPDF2 import PdfReader
+
+    pdf_path = Path(pdf_path)
+    texts = []
+    chunks = []
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PdfReader(file)
+        for page_num in range(start, end):
+            text = pdf_reader.pages[page_num].extract_text()
+            texts.append(text or "")
+            chunks.extend(chunk_page_text(pdf_path, page_num, text, total_pages, params))
+    return texts, chunks
+
+
+def plan_tasks(pdf_paths: list, pages_per_task: int, page_store=None, pdf_hashes: dict = None):
+    """Yield one task per page range, a cache marker for PDFs with stored page text,
+    or a failure marker for unreadable PDFs"""
+    for pdf_path in pdf_paths:
+        sha256 = (pdf_hashes or {}).get(pdf_path.name)
+        if page_store is not None and sha256 and page_store.has(sha256):
+            yield ("cached", pdf_path, sha256)
+            continue
+
+        try:
+            total_pages = count_pages(pdf_path)
+        except Exception as e:
+            yield ("failed", pdf_path, e)
+            continue
+
+        if total_pages == 0:
+            yield ("empty", pdf_path, 0)
+            continue
+
+        for start in range(0, total_pages, pages_per_task):
+            end = min(start + pages_per_task, total_pages)
+            yield ("task", pdf_path, (start, end, total_pages))
+
+
+def iter_chunks(pdf_paths: list, params: dict, workers: int = INGEST_WORKERS,
+                pages_per_task: int = INGEST_PAGES_PER_TASK, page_store=None, pdf_hashes: dict = None):
+    """Stream extraction results in PDF order
+
+    Yields ("chunk", pdf_path, chunk), ("done", pdf_path, total_pages) once all of
+    a PDF's pages are extracted, or ("failed", pdf_path, error). At most
+    2 x workers page ranges are in flight, so memory stays flat however large
+    the corpus grows. With a page_store (and pdf_hashes by file name), PDFs whose
+    page text is already stored are chunked from the store without parsing, and
+    newly extracted PDFs are added to it.
+    """
+    workers = workers or os.cpu_count() or 1
+    pages_per_task = max(1, pages_per_task)
+
+    sha256_of = lambda pdf_path: (pdf_hashes or {}).get(pdf_path.name)
+
+    def finish(pdf_path, state):
+        if state["error"] is not None:
+            return ("failed", pdf_path, state["error"])
+        if page_store is not None and sha256_of(pdf_path):
+            try:
+                pages = [state["pages"][i] for i in range(state["total_pages"])]
+                page_store.write(sha256_of(pdf_path), pages, source=pdf_path.name)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not store page text for {pdf_path.name}: {e}")
+        return ("done", pdf_path, state["total_pages"])
+
+    def from_store(pdf_path, sha256):
+        try:
+            with page_store.open(sha256) as pages:
+                chunks = [
+                    chunk
+                    for page_num, text in enumerate(pages)
+                    for chunk in chunk_page_text(pdf_path, page_num, text, len(pages), params)
+                ]
+                total_pages = len(pages)
+        except Exception as e:
+            yield ("failed", pdf_path, e)
+            return
+
+        for chunk in chunks:
+            yield ("chunk", pdf_path, chunk)
+        yield ("done", pdf_path, total_pages)
+
+    def drain(pending, results):
+        # Results are consumed in submission order so each PDF finishes before the next
+        pdf_path, (start, end, total_pages), result = pending.popleft()
+        state = results.setdefault(pdf_path, {"error": None, "total_pages": total_pages, "remaining": 0, "pages": {}})
+        try:
+            texts, chunks = result.result()
+        except Exception as e:
+            state["error"] = state["error"] or e
+            texts, chunks = [], []
+
+        if state["error"] is None:
+            if page_store is not None:
+                state["pages"].update(zip(range(start, end), texts))
+            for chunk in chunks:
+                yield ("chunk", pdf_path, chunk)
+
+        state["remaining"] -= 1
+        if state["remaining"] == 0:
+            results.pop(pdf_path)
+            yield finish(pdf_path, state)
+
+    results = {}
+    pending = deque()
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    try:
+        for kind, pdf_path, payload in plan_tasks(pdf_paths, pages_per_task, page_store, pdf_hashes):
+            if kind != "task":
+                # Keep output ordered: finish everything already submitted first
+                while pending:
+                    yield from drain(pending, results)
+                if kind == "cached":
+                    yield from from_store(pdf_path, payload)
+                else:
+                    yield ("failed", pdf_path, payload) if kind == "failed" else ("done", pdf_path, 0)
+                continue
+
+            start, end, total_pages = payload
+            state = results.setdefault(pdf_path, {"error": None, "total_pages": total_pages, "remaining": 0, "pages": {}})
+            state["remaining"] += 1
+
+            if executor:
+                future = executor.submit(extract_page_range, str(pdf_path), start, end, total_pages, params)
+            else:
+                future = Future()
+                try:
+                    future.set_result(extract_page_range(str(pdf_path), start, end, total_pages, params))
+                except Exception as e:
+                    future.set_exception(e)
+            pending.append((pdf_path, payload, future))
+
+            while len(pending) >= 2 * workers:
+                yield from drain(pending, results)
+
+        while pending:
+            yield from drain(pending, results)
+    finally:
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def ingest_pdfs(collection, pdf_paths: list, params: dict, encode, on_file_done, on_file_failed,
+                batch_size: int = INGEST_WRITE_BATCH_SIZE, workers: int = INGEST_WORKERS,
+                pages_per_task: int = INGEST_PAGES_PER_TASK, page_store=None, pdf_hashes: dict = None) -> int:
+    """Replace the chunks of the given PDFs, embedding and writing in bounded batches
+
+    Embedding and ChromaDB writes happen in this process while the pool keeps
+    extracting the next page ranges. on_file_done(pdf_path, chunk_lengths, total_pages, seconds, topics)
+    is only called once every chunk of that PDF has been written; seconds runs from
+    its first extracted chunk arriving to its last chunk being written and
+    chunk_lengths holds the character length of each of its chunks, topics how many of them are flagged with each topic.
+    Returns the number of chunks embedded.
+    """
+    batch = []
+    chunk_lengths = {}
+    chunk_topics = {}
+    started_at = {}
+    written_files = []  # finished PDFs waiting for their last chunks to be flushed
+    embedded = 0
+
+    def flush():
+        nonlocal embedded
+        if batch:
+            ids, documents, metadatas = zip(*batch)
+            collection.upsert(
+                ids=list(ids),
+                documents=list(documents),
+                embeddings=encode(list(documents)),
+                metadatas=list(metadatas)
+            )
+            embedded += len(batch)
+            batch.clear()
+
+        while written_files:
+            pdf_path, total_pages = written_files.pop(0)
+            seconds = time.perf_counter() - started_at.pop(pdf_path.name)
+            on_file_done(pdf_path, chunk_lengths.pop(pdf_path.name, []), total_pages, seconds,
+                         dict(chunk_topics.pop(pdf_path.name, Counter())))
+
+    for kind, pdf_path, payload in iter_chunks(pdf_paths, params, workers, pages_per_task, page_store, pdf_hashes):
+        if pdf_path.name not in chunk_lengths:
+            # Drop the previous version's chunks, a shorter PDF may leave stale ids behind
+            logger.info(f"📄 Processing: {pdf_path.name}")
+            collection.delete(where={"source": pdf_path.name})
+            chunk_lengths[pdf_path.name] = []
+            chunk_topics[pdf_path.name] = Counter()
+            started_at[pdf_path.name] = time.perf_counter()
+
+        if kind == "chunk":
+            batch.append(payload)
+            chunk_lengths[pdf_path.name].append(len(payload[1]))
+            chunk_topics[pdf_path.name].update(metadata_topics(payload[2]))
+            if len(batch) >= batch_size:
+                flush()
+        elif kind == "done":
+            written_files.append((pdf_path, payload))
+        else:
+            logger.error(f"❌ Failed to process {pdf_path.name}: {payload}")
+            batch[:] = [chunk for chunk in batch if chunk[2]["source"] != pdf_path.name]
+            collection.delete(where={"source": pdf_path.name})
+            chunk_lengths.pop(pdf_path.name, None)
+            chunk_topics.pop(pdf_path.name, None)
+            started_at.pop(pdf_path.name, None)
+            on_file_failed(pdf_path)
+
+    flush()
+    return embedded
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+RABuddy Lexical Index
+Compact BM25 inverted index stored as .npy arrays and memory-mapped at load time
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+LEXICAL_INDEX_DIRNAME = "bm25"
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do for from has have how i if in is it its me my of on or our
+should so that the their then there this to was we what when where which who will with you your
+""".split())
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+MAX_TOKEN_LENGTH = 32  # longer runs are extraction artifacts and would bloat the vocabulary
+
+
+def tokenize(text: str) -> list:
+    """Lowercased alphanumeric terms; numbers are kept so room numbers and extensions match"""
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOPWORDS and len(token) <= MAX_TOKEN_LENGTH
+    ]
+
+
+def build_lexical_index(index_dir: Path, ids: list, documents: list, index_version: str):
+    """Build the inverted index for all chunks and write it atomically
+
+    Layout: terms.npy (sorted vocabulary), term_offsets.npy (CSR offsets into
+    the postings), postings_doc.npy / postings_tf.npy, doc_lengths.npy,
+    doc_ids.npy and meta.json.
+    """
+    index_dir = Path(index_dir)
+    postings = {}
+    doc_lengths = np.zeros(len(documents), dtype=np.float32)
+
+    for doc_index, document in enumerate(documents):
+        counts = Counter(tokenize(document))
+        doc_lengths[doc_index] = sum(counts.values())
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((doc_index, tf))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    for i, term in enumerate(terms):
+        offsets[i + 1] = offsets[i] + len(postings[term])
+
+    postings_doc = np.empty(offsets[-1], dtype=np.int32)
+    postings_tf = np.empty(offsets[-1], dtype=np.float32)
+    for i, term in enumerate(terms):
+        entries = np.asarray(postings[term], dtype=np.int64)
+        postings_doc[offsets[i]:offsets[i + 1]] = entries[:, 0]
+        postings_tf[offsets[i]:offsets[i + 1]] = entries[:, 1]
+
+    tmp_dir = index_dir.with_name(index_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    np.save(tmp_dir / "terms.npy", np.array(terms, dtype=str) if terms else np.array([], dtype="<U1"))
+    np.save(tmp_dir / "term_offsets.npy", offsets)
+    np.save(tmp_dir / "postings_doc.npy", postings_doc)
+    np.save(tmp_dir / "postings_tf.npy", postings_tf)
+    np.save(tmp_dir / "doc_lengths.npy", doc_lengths)
+    np.save(tmp_dir / "doc_ids.npy", np.array(ids, dtype=str) if ids else np.array([], dtype="<U1"))
+    with open(tmp_dir / "meta.json", 'w') as f:
+        json.dump({
+            "index_version": index_version,
+            "documents": len(documents),
+            "terms": len(terms),
+            "avg_doc_length": float(doc_lengths.mean()) if len(documents) else 0.0,
+            "k1": BM25_K1,
+            "b": BM25_B
+        }, f)
+
+    # Swap directories so readers never see a half-written index
+    old_dir = index_dir.with_name(index_dir.name + ".old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if index_dir.exists():
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    logger.info(f"🔤 Lexical index built: {len(documents)} chunks, {len(terms)} terms")
+
+
+def read_index_version(index_dir: Path):
+    """Version the on-disk index was built for, or None if missing"""
+    try:
+        with open(Path(index_dir) / "meta.json") as f:
+            return json.load(f).get("index_version")
+    except (OSError, ValueError):
+        return None
+
+
+class LexicalIndex:
+    """Read-only BM25 searcher over memory-mapped arrays; loading touches no postings"""
+
+    def __init__(self, index_dir: Path):
+        index_dir = Path(index_dir)
+        with open(index_dir / "meta.json") as f:
+            self.meta = json.load(f)
+
+        load = lambda name: np.load(index_dir / name, mmap_mode='r')
+        self.terms = load("terms.npy")
+        self.term_offsets = load("term_offsets.npy")
+        self.postings_doc = load("postings_doc.npy")
+        self.postings_tf = load("postings_tf.npy")
+        self.doc_lengths = load("doc_lengths.npy")
+        self.doc_ids = load("doc_ids.npy")
+
+        self.index_version = self.meta["index_version"]
+        self.doc_count = self.meta["documents"]
+        self.avg_doc_length = self.meta["avg_doc_length"] or 1.0
+
+    def _term_index(self, term: str):
+        position = int(np.searchsorted(self.terms, term))
+        if position < len(self.terms) and self.terms[position] == term:
+            return position
+        return None
+
+    def search(self, query: str, top_k: int = 8) -> list:
+        """Return [(chunk_id, bm25_score)] for the best-matching chunks"""
+        if self.doc_count == 0:
+            return []
+
+        scores = np.zeros(self.doc_count, dtype=np.float32)
+        k1, b = self.meta["k1"], self.meta["b"]
+
+        for term in set(tokenize(query)):
+            position = self._term_index(term)
+            if position is None:
+                continue
+
+            start, end = int(self.term_offsets[position]), int(self.term_offsets[position + 1])
+            docs = np.asarray(self.postings_doc[start:end])
+            tf = np.asarray(self.postings_tf[start:end])
+            df = end - start
+
+            idf = np.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+            norm = k1 * (1 - b + b * np.asarray(self.doc_lengths[docs]) / self.avg_doc_length)
+            scores[docs] += idf * tf * (k1 + 1) / (tf + norm)
+
+        matched = np.flatnonzero(scores > 0)
+        if matched.size == 0:
+            return []
+
+        best = matched[np.argsort(-scores[matched], kind="stable")[:top_k]]
+        return [(str(self.doc_ids[i]), float(scores[i])) for i in best]
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60) -> list:
+    """Fuse several ranked id lists; returns ids ordered by summed 1 / (k + rank)"""
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused, key=fused.get, reverse=True)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+RABuddy Ingestion Manifest
+Tracks which PDFs are already embedded so restarts only re-process changed files
+"""
+
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+MANIFEST_FILENAME = "ingest_manifest.json"
+
+
+def file_sha256(path: Path) -> str:
+    """Hash a file's contents in fixed-size blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def empty_manifest(params: dict) -> dict:
+    """Create a manifest with no ingested files"""
+    return {
+        "version": MANIFEST_VERSION,
+        "params": params,
+        "files": {}
+    }
+
+
+def load_manifest(store_path: Path, params: dict) -> dict:
+    """Load the manifest, discarding it if chunking or embedding parameters changed"""
+    manifest_path = Path(store_path) / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return empty_manifest(params)
+
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    except Exception as e:
+        logger.warning(f"⚠️ Ignoring unreadable ingest manifest: {e}")
+        return empty_manifest(params)
+
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("params") != params:
+        logger.info("🔁 Ingestion parameters changed, all PDFs will be re-ingested")
+        return empty_manifest(params)
+
+    return manifest
+
+
+def save_manifest(store_path: Path, manifest: dict):
+    """Write the manifest atomically so a crash never leaves it half-written"""
+    store_path = Path(store_path)
+    store_path.mkdir(parents=True, exist_ok=True)
+    manifest_path = store_path / MANIFEST_FILENAME
+    tmp_path = manifest_path.with_suffix(".json.tmp")
+
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def plan_changes(manifest: dict, pdf_paths: list) -> dict:
+    """Compare PDFs on disk against the manifest
+
+    Returns the files to (re-)ingest with their hashes, the unchanged files,
+    and the manifest entries whose PDF no longer exists.
+    """
+    on_disk = {path.name: path for path in pdf_paths}
+    changed = []
+    unchanged = []
+
+    for name, path in sorted(on_disk.items()):
+        sha256 = file_sha256(path)
+        entry = manifest["files"].get(name)
+        if entry and entry.get("sha256") == sha256:
+            unchanged.append(name)
+        else:
+            changed.append((path, sha256))
+
+    removed = sorted(name for name in manifest["files"] if name not in on_disk)
+
+    return {
+        "changed": changed,
+        "unchanged": unchanged,
+        "removed": removed
+    }
+
+
+def record_file(manifest: dict, name: str, sha256: str, chunk_count: int, total_pages: int,
+                ingest_seconds: float = None, chunk_length_histogram: list = None,
+                doc_type: str = None, topics: dict = None):
+    """Record a successfully ingested PDF"""
+    manifest["files"][name] = {
+        "sha256": sha256,
+        "chunk_count": chunk_count,
+        "total_pages": total_pages,
+        "ingest_seconds": round(ingest_seconds, 3) if ingest_seconds is not None else None,
+        "chunk_length_histogram": chunk_length_histogram,
+        "doc_type": doc_type,
+        "topics": topics or {},
+        "ingested_at": datetime.now().isoformat()
+    }
+
+
+def manifest_chunk_count(manifest: dict) -> int:
+    """Total chunks the manifest expects to find in the collection"""
+    return sum(entry.get("chunk_count", 0) for entry in manifest["files"].values())
+
+
+def manifest_chunk_histogram(manifest: dict) -> list:
+    """Chunk-length histogram summed over every PDF (bins as in chunking.CHUNK_LENGTH_BINS)"""
+    total = []
+    for entry in manifest["files"].values():
+        counts = entry.get("chunk_length_histogram") or []
+        total = [a + b for a, b in zip(total, counts)] if total else list(counts)
+    return total
+
+
+def manifest_catalog(manifest: dict) -> dict:
+    """Chunk counts per source, doc_type and topic, for validating filters and routing queries"""
+    catalog = {"sources": {}, "doc_types": {}, "topics": {}}
+    for name, entry in manifest["files"].items():
+        catalog["sources"][name] = entry.get("chunk_count", 0)
+        if entry.get("doc_type"):
+            doc_types = catalog["doc_types"]
+            doc_types[entry["doc_type"]] = doc_types.get(entry["doc_type"], 0) + entry.get("chunk_count", 0)
+        for topic, count in (entry.get("topics") or {}).items():
+            catalog["topics"][topic] = catalog["topics"].get(topic, 0) + count
+    return catalog
+
+
+def manifest_version(manifest: dict) -> str:
+    """Short fingerprint of the indexed corpus; changes whenever any chunk could have changed"""
+    fingerprint = {
+        "params": manifest.get("params"),
+        "files": {name: entry.get("sha256") for name, entry in manifest["files"].items()}
+    }
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()[:12]
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+RABuddy Page Text Store
+Extracted PDF page text keyed by PDF content hash, so rebuilds and re-chunking skip PDF parsing
+"""
+
+import json
+import logging
+import mmap
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PAGE_TEXT_DIRNAME = "page_text"
+PAGE_TEXT_FORMAT = 1
+
+
+class PageTexts:
+    """Lazy read-only view of one PDF's pages: offsets.npy is memory-mapped, pages.txt is mmapped UTF-8"""
+
+    def __init__(self, entry_dir: Path):
+        self.offsets = np.load(entry_dir / "offsets.npy", mmap_mode='r')
+        self._file = open(entry_dir / "pages.txt", 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, page_num: int) -> str:
+        if not 0 <= page_num < len(self):
+            raise IndexError(f"page {page_num} out of range (0-{len(self) - 1})")
+        start, end = int(self.offsets[page_num]), int(self.offsets[page_num + 1])
+        return self._data[start:end].decode('utf-8')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PageTextStore:
+    """One directory per PDF hash holding pages.txt (all pages, concatenated) and offsets.npy
+
+    Entries are written to a temporary directory and renamed into place, so a
+    reader never sees a partial entry.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _entry_dir(self, sha256: str) -> Path:
+        return self.root / sha256
+
+    def has(self, sha256: str) -> bool:
+        try:
+            with open(self._entry_dir(sha256) / "meta.json") as f:
+                return json.load(f).get("format") == PAGE_TEXT_FORMAT
+        except (OSError, ValueError):
+            return False
+
+    def write(self, sha256: str, pages: list, source: str = None):
+        """Store every page's text for one PDF version"""
+        encoded = [(text or "").encode('utf-8') for text in pages]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(data) for data in encoded])
+
+        entry_dir = self._entry_dir(sha256)
+        tmp_dir = entry_dir.with_name(entry_dir.name + ".tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+
+        with open(tmp_dir / "pages.txt", 'wb') as f:
+            for data in encoded:
+                f.write(data)
+        np.save(tmp_dir / "offsets.npy", offsets)
+        with open(tmp_dir / "meta.json", 'w') as f:
+            json.dump({"format": PAGE_TEXT_FORMAT, "pages": len(encoded), "source": source}, f)
+
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+
+    def open(self, sha256: str) -> PageTexts:
+        return PageTexts(self._entry_dir(sha256))
+
+    def page_text(self, sha256: str, page_num: int) -> str:
+        """Text of one page (0-based) without opening the PDF"""
+        with self.open(sha256) as pages:
+            return pages[page_num]
+
+    def prune(self, keep: set) -> int:
+        """Delete entries for PDF versions no longer on disk; returns how many were removed"""
+        if not self.root.exists():
+            return 0
+
+        removed = 0
+        for entry_dir in self.root.iterdir():
+            if entry_dir.is_dir() and entry_dir.name not in keep:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info(f"🧹 Removed {removed} stale page-text entries")
+        return removed
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+RABuddy Query Embedding Cache
+Question vectors keyed by normalized text and embedding space, in memory and in a memory-mapped float32 store
+"""
+
+import atexit
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUERY_EMBEDDING_CACHE_ENABLED = os.getenv('QUERY_EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+QUERY_EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv('QUERY_EMBEDDING_CACHE_MEMORY_ENTRIES', 4096))
+QUERY_EMBEDDING_CACHE_DISK_ENTRIES = int(os.getenv('QUERY_EMBEDDING_CACHE_DISK_ENTRIES', 50000))
+QUERY_EMBEDDING_CACHE_FLUSH_SECONDS = float(os.getenv('QUERY_EMBEDDING_CACHE_FLUSH_SECONDS', 30))
+QUERY_EMBEDDING_DIRNAME = "query_embeddings"
+QUERY_EMBEDDING_FORMAT = 1
+CURRENT_FILENAME = "current.json"
+
+
+def embedding_key(text: str) -> str:
+    """Lowercased, whitespace-collapsed text
+
+    Punctuation is kept: the model is uncased and ignores whitespace, so texts
+    with the same key get the same vector.
+    """
+    return " ".join(text.lower().split())
+
+
+def key_hash(space_id: str, key: str) -> int:
+    """64-bit id of a key within one embedding space"""
+    digest = hashlib.blake2b(f"{space_id}\n{key}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class DiskGeneration:
+    """One read-only snapshot: vectors.npy (N x dim float32) and keys.npy (uint64, insertion order), memory-mapped"""
+
+    def __init__(self, directory: Path):
+        with open(directory / "meta.json") as f:
+            self.meta = json.load(f)
+        self.directory = directory
+        self.vectors = np.load(directory / "vectors.npy", mmap_mode='r')
+        self.keys = np.load(directory / "keys.npy", mmap_mode='r')
+        self.order = np.argsort(self.keys, kind='stable')  # N int64s; the vectors stay on disk
+        self.sorted_keys = np.asarray(self.keys)[self.order]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def get(self, hashed: int):
+        position = int(np.searchsorted(self.sorted_keys, np.uint64(hashed)))
+        if position < len(self.sorted_keys) and self.sorted_keys[position] == np.uint64(hashed):
+            return np.array(self.vectors[self.order[position]], dtype=np.float32)
+        return None
+
+
+class QueryEmbeddingCache:
+    """Memory-bounded LRU in front of a memory-mapped on-disk store
+
+    Lookups check the LRU, then the current disk generation. New vectors are
+    buffered and merged into a new generation by a background flush (and at
+    exit); the pointer file is swapped atomically, so other workers can keep
+    reading their mapped generation and pick up the new one on their next miss.
+    The store is tied to the engine's space_id: after a model change the old
+    generation is ignored and replaced on the next flush.
+    """
+
+    def __init__(self, root: Path, memory_entries: int = QUERY_EMBEDDING_CACHE_MEMORY_ENTRIES,
+                 disk_entries: int = QUERY_EMBEDDING_CACHE_DISK_ENTRIES,
+                 flush_seconds: float = QUERY_EMBEDDING_CACHE_FLUSH_SECONDS,
+                 enabled: bool = QUERY_EMBEDDING_CACHE_ENABLED):
+        self.root = Path(root)
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.flush_seconds = flush_seconds
+        self.enabled = enabled
+        self.space_id = None
+        self._memory = OrderedDict()  # key hash -> float32 vector
+        self._pending = OrderedDict()  # key hash -> vector not yet on disk
+        self._disk = None
+        self._disk_pointer = None
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "flushes": 0, "invalidations": 0}
+        atexit.register(self.flush)
+
+    def open(self, space_id: str):
+        """Bind the cache to the engine's vector space; entries from any other space are dropped"""
+        with self._lock:
+            if space_id != self.space_id:
+                if self.space_id is not None:
+                    self._stats["invalidations"] += 1
+                self.space_id = space_id
+                self._memory.clear()
+                self._pending.clear()
+                self._disk, self._disk_pointer = None, None
+        self._reload()
+
+    def _read_pointer(self):
+        try:
+            with open(self.root / CURRENT_FILENAME) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _reload(self):
+        """Map the current generation if it changed since the last look"""
+        pointer = self._read_pointer()
+        if pointer == self._disk_pointer:
+            return
+        disk = None
+        if pointer and pointer.get("space_id") == self.space_id and pointer.get("format") == QUERY_EMBEDDING_FORMAT:
+            try:
+                disk = DiskGeneration(self.root / pointer["generation"])
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Query embedding cache unreadable, starting empty: {e}")
+        elif pointer:
+            logger.info("🔄 Query embedding cache was built for another embedding model, ignoring it")
+            with self._lock:
+                self._stats["invalidations"] += 1
+        with self._lock:
+            self._disk, self._disk_pointer = disk, pointer
+
+    def _remember(self, hashed: int, vector):
+        self._memory[hashed] = vector
+        self._memory.move_to_end(hashed)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, text: str):
+        """Cached vector for text (a float32 array) or None"""
+        if not self.enabled or self.space_id is None:
+            return None
+
+        hashed = key_hash(self.space_id, embedding_key(text))
+        with self._lock:
+            vector = self._memory.get(hashed)
+            if vector is not None:
+                self._memory.move_to_end(hashed)
+                self._stats["memory_hits"] += 1
+                return vector
+            disk = self._disk
+
+        vector = disk.get(hashed) if disk is not None else None
+        if vector is None:
+            self._reload()  # another worker may have flushed a newer generation
+            with self._lock:
+                disk = self._disk if self._disk is not disk else None
+            vector = disk.get(hashed) if disk is not None else None
+
+        with self._lock:
+            if vector is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            self._remember(hashed, vector)
+            return vector
+
+    def put(self, text: str, vector):
+        if not self.enabled or self.space_id is None:
+            return
+
+        hashed = key_hash(self.space_id, embedding_key(text))
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(hashed, vector)
+            self._pending[hashed] = vector
+            while len(self._pending) > self.disk_entries:
+                self._pending.popitem(last=False)
+        self._ensure_flusher()
+
+    def encode(self, texts: list, encode) -> list:
+        """Vectors for texts, calling encode(texts) once for the misses only"""
+        vectors = [self.get(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Repeats within one call are encoded once
+            unique = list(dict.fromkeys(embedding_key(texts[i]) for i in missing))
+            first = {}
+            for i in missing:
+                first.setdefault(embedding_key(texts[i]), texts[i])
+            encoded = dict(zip(unique, encode([first[key] for key in unique])))
+            for i in missing:
+                vectors[i] = encoded[embedding_key(texts[i])]
+            for key in unique:
+                self.put(first[key], encoded[key])
+        return [vector.tolist() if isinstance(vector, np.ndarray) else vector for vector in vectors]
+
+    def encode_query(self, text: str, encode) -> list:
+        return self.encode([text], encode)[0]
+
+    def _ensure_flusher(self):
+        # Started lazily so each pre-forked worker gets its own thread
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="rabuddy-embedding-cache", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"💥 Query embedding cache flush failed: {e}")
+
+    def flush(self):
+        """Merge buffered vectors into a new disk generation (newest disk_entries kept)"""
+        with self._lock:
+            if not self._pending or not self.enabled:
+                return
+            pending, self._pending = self._pending, OrderedDict()
+            space_id = self.space_id
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        lock_fd = os.open(self.root / ".lock", os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)  # workers flushing together would drop each other's entries
+            pointer = self._read_pointer()
+            keys = np.fromiter(pending.keys(), dtype=np.uint64, count=len(pending))
+            vectors = np.stack(list(pending.values()))
+            if pointer and pointer.get("space_id") == space_id and pointer.get("format") == QUERY_EMBEDDING_FORMAT:
+                try:
+                    current = DiskGeneration(self.root / pointer["generation"])
+                    keep = ~np.isin(current.keys, keys)
+                    if current.vectors.shape[1] == vectors.shape[1]:
+                        keys = np.concatenate([np.asarray(current.keys)[keep], keys])
+                        vectors = np.concatenate([np.asarray(current.vectors)[keep], vectors])
+                except (OSError, ValueError) as e:
+                    logger.warning(f"⚠️ Rewriting unreadable query embedding cache: {e}")
+            keys, vectors = keys[-self.disk_entries:], vectors[-self.disk_entries:]
+
+            generation = f"gen_{time.time_ns()}"
+            tmp_dir = self.root / f".{generation}.tmp"
+            tmp_dir.mkdir()
+            np.save(tmp_dir / "vectors.npy", np.ascontiguousarray(vectors, dtype=np.float32))
+            np.save(tmp_dir / "keys.npy", keys)
+            meta = {"format": QUERY_EMBEDDING_FORMAT, "space_id": space_id, "count": len(keys), "dim": int(vectors.shape[1])}
+            with open(tmp_dir / "meta.json", 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp_dir, self.root / generation)
+
+            pointer_tmp = self.root / f"{CURRENT_FILENAME}.tmp"
+            with open(pointer_tmp, 'w') as f:
+                json.dump({"generation": generation, "space_id": space_id, "format": QUERY_EMBEDDING_FORMAT}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(pointer_tmp, self.root / CURRENT_FILENAME)
+
+            # Readers that still map an old generation keep their open files
+            for entry in self.root.iterdir():
+                if entry.is_dir() and entry.name != generation and entry.name.startswith("gen_"):
+                    shutil.rmtree(entry, ignore_errors=True)
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+
+        with self._lock:
+            self._stats["flushes"] += 1
+        self._reload()
+        logger.info(f"💾 Query embedding cache: {len(keys)} vectors on disk")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["memory_hits"] + self._stats["disk_hits"] + self._stats["misses"]
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            return {
+                **self._stats,
+                "enabled": self.enabled,
+                "space_id": self.space_id,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._disk) if self._disk is not None else 0,
+                "pending": len(self._pending),
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0
+            }
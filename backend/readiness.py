@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+RABuddy Readiness Tracking
+Per-component warm-up status and timings, reported by /api/ready
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupTracker:
+    """Records the warm-up progress of each startup component"""
+
+    def __init__(self, components: list):
+        self._lock = threading.Lock()
+        self._components = {name: {"status": "pending"} for name in components}
+        self._started = time.monotonic()
+
+    def run(self, name: str, step) -> bool:
+        """Run one warm-up step (a callable returning bool) and record the outcome"""
+        started = time.perf_counter()
+        with self._lock:
+            self._components[name] = {
+                "status": "warming",
+                "started_at": datetime.now().isoformat()
+            }
+
+        try:
+            ok = bool(step())
+            error = None if ok else "step reported failure"
+        except Exception as e:
+            ok = False
+            error = str(e)
+
+        seconds = round(time.perf_counter() - started, 3)
+        with self._lock:
+            self._components[name].update({
+                "status": "ready" if ok else "failed",
+                "seconds": seconds
+            })
+            if error:
+                self._components[name]["error"] = error
+
+        if ok:
+            logger.info(f"✅ {name} ready in {seconds:.2f}s")
+        else:
+            logger.error(f"❌ {name} failed after {seconds:.2f}s: {error}")
+        return ok
+
+    def is_ready(self) -> bool:
+        with self._lock:
+            return all(c["status"] == "ready" for c in self._components.values())
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            components = {name: dict(c) for name, c in self._components.items()}
+        return {
+            "ready": all(c["status"] == "ready" for c in components.values()),
+            "uptime_seconds": round(time.monotonic() - self._started, 1),
+            "components": components
+        }
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+RABuddy Rebuild Jobs
+Runs index rebuilds in a background thread, one at a time, with progress for the job-status endpoint
+"""
+
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class RebuildInProgress(Exception):
+    """A different rebuild is already running"""
+
+    def __init__(self, job):
+        super().__init__(f"Rebuild {job.id} is already running")
+        self.job = job
+
+
+class RebuildJob:
+    """Status of one rebuild; progress fields are set by the build as it goes"""
+
+    def __init__(self, force: bool):
+        self.id = uuid.uuid4().hex[:12]
+        self.force = force
+        self.state = "running"
+        self.created_at = datetime.now().isoformat()
+        self.finished_at = None
+        self.seconds = None
+        self.progress = {"phase": "queued"}
+        self.result = None
+        self.error = None
+        self.merged_requests = 0
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def update(self, **progress):
+        with self._lock:
+            self.progress.update(progress)
+
+    def finish(self, result: dict = None, error: str = None):
+        with self._lock:
+            self.state = "failed" if error else "succeeded"
+            self.result = result
+            self.error = error
+            self.finished_at = datetime.now().isoformat()
+            self.seconds = round(time.perf_counter() - self._started, 3)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "state": self.state,
+                "force": self.force,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+                "seconds": self.seconds if self.seconds is not None else round(time.perf_counter() - self._started, 3),
+                "progress": dict(self.progress),
+                "merged_requests": self.merged_requests,
+                "result": self.result,
+                "error": self.error
+            }
+
+
+class RebuildJobs:
+    """Starts rebuild jobs and keeps the last few for status queries
+
+    Only one job runs at a time. A request matching the running job (same
+    force flag) joins it; a different one raises RebuildInProgress.
+    """
+
+    def __init__(self, history: int = 20):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._order = []
+        self._running = None
+        self.history = history
+
+    def submit(self, run, force: bool = False) -> tuple:
+        """Start run(job) in a background thread; returns (job, merged)"""
+        with self._lock:
+            running = self._running
+            if running is not None:
+                if running.force != force:
+                    raise RebuildInProgress(running)
+                running.merged_requests += 1
+                return running, True
+
+            job = RebuildJob(force)
+            self._running = job
+            self._jobs[job.id] = job
+            self._order.append(job.id)
+            while len(self._order) > self.history:
+                self._jobs.pop(self._order.pop(0), None)
+
+        thread = threading.Thread(target=self._run, args=(job, run), name=f"rabuddy-rebuild-{job.id}", daemon=True)
+        thread.start()
+        return job, False
+
+    def _run(self, job: RebuildJob, run):
+        logger.info(f"🔄 Rebuild {job.id} started (force={job.force})")
+        try:
+            job.finish(result=run(job))
+            logger.info(f"✅ Rebuild {job.id} finished in {job.seconds:.2f}s")
+        except Exception as e:
+            job.finish(error=str(e))
+            logger.error(f"💥 Rebuild {job.id} failed: {e}")
+        finally:
+            with self._lock:
+                self._running = None
+
+    def get(self, job_id: str) -> RebuildJob:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest(self) -> RebuildJob:
+        with self._lock:
+            return self._jobs[self._order[-1]] if self._order else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._running.id if self._running else None,
+                "jobs": len(self._order)
+            }
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+RABuddy Query Routing
+Document types and topic tags stamped on chunks at ingest, metadata filters for search, and a keyword router
+"""
+
+import os
+import re
+
+QUERY_ROUTING = os.getenv('QUERY_ROUTING', 'true').lower() == 'true'
+ROUTE_MIN_TOPIC_HITS = int(os.getenv('ROUTE_MIN_TOPIC_HITS', 2))
+TAGGER_VERSION = 2  # bump when the rules below change; part of the ingest params, so chunks get re-tagged
+
+FILTER_KEYS = ("source", "doc_type", "topic")
+MAX_FILTER_VALUES = 20
+DEFAULT_DOC_TYPE = "csu_housing_policy"
+DEFAULT_TOPIC = "general"
+
+# First matching file-name pattern decides a PDF's doc_type
+DOC_TYPE_RULES = [
+    (re.compile(r"evacuation|assembly", re.IGNORECASE), "evacuation_areas"),
+    (re.compile(r"prohibited", re.IGNORECASE), "prohibited_items"),
+    (re.compile(r"protocol", re.IGNORECASE), "duty_protocol"),
+    (re.compile(r"duty manual", re.IGNORECASE), "duty_manual"),
+]
+
+# Questions that name a kind of document are searched in those documents only
+DOC_TYPE_QUERY_RULES = [
+    (re.compile(r"\bassembly (?:area|point|location|site)s?\b", re.IGNORECASE), "evacuation_areas"),
+    (re.compile(r"\bprohibited items? list\b", re.IGNORECASE), "prohibited_items"),
+    (re.compile(r"\bprotocol snapshot\b", re.IGNORECASE), "duty_protocol"),
+    (re.compile(r"\bduty manual\b", re.IGNORECASE), "duty_manual"),
+]
+
+# Topic -> terms; a chunk is flagged with every topic whose terms it mentions. Terms match whole words (plurals
+# included); a trailing "*" marks a stem ("evacuat*" matches evacuate and evacuation, "pet" doesn't match petition)
+TOPIC_TERMS = {
+    "evacuation": ["evacuat*", "assembly area", "assembly point", "fire alarm", "fire drill", "drill"],
+    "prohibited_items": ["prohibited", "candle", "incense", "weapon", "firearm", "hoverboard", "space heater",
+                         "halogen", "extension cord", "string light", "appliance", "pet", "drone"],
+    "emergency": ["emergenc*", "medical", "ambulance", "911", "police", "csupd", "injur*", "overdose",
+                  "suicid*", "welfare check", "hospital"],
+    "lockout": ["lockout", "locked out", "lock out", "key", "card access", "spare key"],
+    "conduct": ["alcohol", "drug", "marijuana", "cannabis", "noise", "quiet hour", "guest", "visitor",
+                "smoking", "vaping", "conduct", "courtesy hour"],
+    "facilities": ["maintenance", "leak*", "flood*", "power outage", "elevator", "work order", "mold",
+                   "heating", "plumbing", "broken"],
+    "duty": ["on-call", "on call", "on duty", "duty phone", "rounds", "shift", "duty log", "incident report",
+             "supervisor", "pro staff"],
+}
+
+
+def term_pattern(term: str) -> str:
+    """Regex for one topic term: a whole word or phrase with an optional plural, or a stem"""
+    if term.endswith("*"):
+        return re.escape(term[:-1]) + r"\w*"
+    return re.escape(term) + r"(?:e?s)?\b"
+
+
+TOPIC_PATTERNS = {
+    topic: re.compile(r"\b(?:" + "|".join(term_pattern(term) for term in terms) + ")", re.IGNORECASE)
+    for topic, terms in TOPIC_TERMS.items()
+}
+
+
+def document_type(filename: str) -> str:
+    """doc_type stored on every chunk of a PDF"""
+    for pattern, doc_type in DOC_TYPE_RULES:
+        if pattern.search(filename):
+            return doc_type
+    return DEFAULT_DOC_TYPE
+
+
+def topic_scores(text: str) -> dict:
+    """Topic -> number of its terms found in text (topics without hits left out)"""
+    scores = {}
+    for topic, pattern in TOPIC_PATTERNS.items():
+        hits = len(pattern.findall(text))
+        if hits:
+            scores[topic] = hits
+    return scores
+
+
+def topic_key(topic: str) -> str:
+    """Boolean chunk metadata field flagging one topic (ChromaDB metadata can't hold lists)"""
+    return f"topic_{topic}"
+
+
+def topic_metadata(text: str) -> dict:
+    """Chunk metadata: "topic" (dominant topic) plus a topic_<name> flag per topic mentioned
+
+    Chunks without any topic term get DEFAULT_TOPIC. Filtering on the flags
+    instead of the dominant topic keeps chunks that cover several topics.
+    """
+    scores = topic_scores(text) or {DEFAULT_TOPIC: 1}
+    topics = sorted(scores, key=lambda topic: -scores[topic])  # stable: ties keep TOPIC_TERMS order
+    return {"topic": topics[0], **{topic_key(topic): True for topic in topics}}
+
+
+def metadata_topics(metadata: dict) -> list:
+    """Topics flagged on a chunk"""
+    prefix = topic_key("")
+    return [key[len(prefix):] for key, value in metadata.items() if key.startswith(prefix) and value is True]
+
+
+def route_query(question: str, catalog: dict) -> tuple:
+    """Filters for a question that clearly targets one document type or topic; (filters, reason) or (None, None)
+
+    A named document type wins. Otherwise the question's terms must point at
+    exactly one topic that the index actually holds chunks for, with at least
+    ROUTE_MIN_TOPIC_HITS mentions: one stray keyword isn't enough to narrow
+    the search. Anything ambiguous searches the whole index.
+    """
+    for pattern, doc_type in DOC_TYPE_QUERY_RULES:
+        if pattern.search(question) and catalog.get("doc_types", {}).get(doc_type):
+            return {"doc_type": [doc_type]}, f"names {doc_type}"
+
+    scores = topic_scores(question)
+    if len(scores) == 1:
+        topic, hits = next(iter(scores.items()))
+        if hits >= ROUTE_MIN_TOPIC_HITS and catalog.get("topics", {}).get(topic):
+            return {"topic": [topic]}, f"topic {topic}"
+    return None, None
+
+
+def parse_filters(filters, catalog: dict = None) -> dict:
+    """Validate request filters ({"source": "X.pdf"} or lists of values) into {key: [values]}
+
+    Raises ValueError for unknown keys, bad values, or values the index
+    doesn't contain (when a catalog is given).
+    """
+    if filters is None:
+        return {}
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object")
+
+    parsed = {}
+    for key, values in filters.items():
+        if key not in FILTER_KEYS:
+            raise ValueError(f"Unknown filter '{key}', expected one of: {', '.join(FILTER_KEYS)}")
+        values = [values] if isinstance(values, str) else values
+        if not isinstance(values, list) or not values or len(values) > MAX_FILTER_VALUES \
+                or not all(isinstance(value, str) and value for value in values):
+            raise ValueError(f"Filter '{key}' must be a string or a list of up to {MAX_FILTER_VALUES} strings")
+
+        known = (catalog or {}).get(f"{key}s")
+        if known:
+            unknown = [value for value in values if value not in known]
+            if unknown:
+                raise ValueError(f"Unknown {key}: {', '.join(unknown)}")
+        parsed[key] = sorted(set(values))
+    return parsed
+
+
+def where_clause(filters: dict) -> dict:
+    """ChromaDB where clause for parsed filters (None for no filters)
+
+    Values of one key are alternatives, keys must all match. A topic matches
+    every chunk flagged with it, not only chunks where it dominates.
+    """
+    clauses = []
+    for key, values in sorted((filters or {}).items()):
+        if key == "topic":
+            options = [{topic_key(topic): True} for topic in values]
+            clauses.append(options[0] if len(options) == 1 else {"$or": options})
+        else:
+            clauses.append({key: values[0]} if len(values) == 1 else {key: {"$in": values}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
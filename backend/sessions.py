@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+RABuddy Conversation Sessions
+Bounded server-side history per session, used to turn follow-ups into standalone retrieval queries
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+from context_builder import estimate_tokens
+from lexical_index import tokenize
+
+SESSIONS_ENABLED = os.getenv('SESSIONS_ENABLED', 'true').lower() == 'true'
+SESSION_MAX_SESSIONS = int(os.getenv('SESSION_MAX_SESSIONS', 2000))
+SESSION_TTL_SECONDS = float(os.getenv('SESSION_TTL_SECONDS', 60 * 60))
+SESSION_MAX_TURNS = int(os.getenv('SESSION_MAX_TURNS', 6))
+SESSION_ANSWER_CHARS = int(os.getenv('SESSION_ANSWER_CHARS', 300))
+SESSION_HISTORY_TOKENS = int(os.getenv('SESSION_HISTORY_TOKENS', 300))
+SESSION_STORE_PATH = os.getenv('SESSION_STORE_PATH', str(Path(__file__).parent / "session_store"))  # "" keeps sessions per process
+SESSION_PRUNE_EVERY = 200  # turns recorded between sweeps of the session directory
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+CITATION_PATTERN = re.compile(r"\s*\(Source \d+\)")
+FOLLOWUP_PREFIX = re.compile(r"^\s*(?:and|but|also|so|then|ok(?:ay)?|what about|how about|what if|same for|in that case)\b", re.IGNORECASE)
+REFERENCE_WORDS = frozenset("it its that this those these they them their he she his her one ones".split())  # not "there": "is there a curfew?"
+FILLER_WORDS = frozenset("about also after before else just now ok okay please so then what".split())
+TOPIC_TERMS = 12  # previous-query terms carried into a rewritten follow-up
+
+
+def valid_session_id(session_id) -> bool:
+    return isinstance(session_id, str) and bool(SESSION_ID_PATTERN.match(session_id))
+
+
+def compress_answer(answer: str, max_chars: int = SESSION_ANSWER_CHARS) -> str:
+    """Condense an answer for the history: citations dropped, leading sentences up to max_chars"""
+    text = " ".join(CITATION_PATTERN.sub("", answer or "").split())
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(". ", 0, max_chars)
+    if cut > max_chars // 2:
+        return text[:cut + 1]
+    return text[:max_chars].rsplit(" ", 1)[0] + "…"
+
+
+def is_followup(question: str, history: list) -> bool:
+    """Whether a question only makes sense after the previous turn ("what about after 2am?")
+
+    Needs an explicit signal: a follow-up opener, or a short question that
+    refers back with a pronoun. Short questions alone ("Can I have a
+    candle?", "Thanks!") stand on their own.
+    """
+    if not history:
+        return False
+    if FOLLOWUP_PREFIX.match(question):
+        return True
+    words = re.findall(r"[a-z0-9']+", question.lower())
+    content = [term for term in tokenize(question) if term not in FILLER_WORDS]
+    return len(content) <= 4 and any(word in REFERENCE_WORDS for word in words)
+
+
+def rewrite_followup(question: str, history: list) -> str:
+    """Standalone retrieval query: a follow-up gets the previous query's topic terms prepended
+
+    No LLM call is made. The previous turn's query is already standalone, so
+    chains of follow-ups keep their topic without the query growing.
+    """
+    if not is_followup(question, history):
+        return question
+
+    topic = []
+    for term in tokenize(history[-1]["query"]):
+        if len(term) > 1 and term not in FILLER_WORDS and term not in topic:
+            topic.append(term)
+    return f"{' '.join(topic[:TOPIC_TERMS])} {question.strip()}"
+
+
+def history_for_prompt(history: list, token_budget: int = SESSION_HISTORY_TOKENS) -> list:
+    """The most recent turns that fit in token_budget, oldest first"""
+    selected = []
+    used = 0
+    for turn in reversed(history):
+        tokens = estimate_tokens(turn["question"]) + estimate_tokens(turn["answer"]) + 4
+        if used + tokens > token_budget:
+            break
+        selected.append(turn)
+        used += tokens
+    return selected[::-1]
+
+
+class SessionStore:
+    """LRU + TTL map of session id -> rolling history, optionally shared through a directory
+
+    Each history keeps the last max_turns turns (question, standalone query,
+    condensed answer), stored zlib-compressed, so memory stays bounded by
+    max_sessions * max_turns * answer_chars before compression. With a
+    directory, every session is also a small file there, replaced atomically
+    on each turn: gunicorn workers then see each other's turns, and the
+    in-memory copy is only reused while the file's mtime hasn't changed.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, ttl_seconds: float = SESSION_TTL_SECONDS,
+                 max_turns: int = SESSION_MAX_TURNS, answer_chars: int = SESSION_ANSWER_CHARS,
+                 enabled: bool = SESSIONS_ENABLED, directory=SESSION_STORE_PATH):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self.answer_chars = answer_chars
+        self.enabled = enabled
+        self.directory = Path(directory) if directory else None
+        self._sessions = OrderedDict()  # session id -> (compressed history, updated_at, file mtime_ns)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"evictions": 0, "expirations": 0, "turns_recorded": 0, "disk_reads": 0}
+
+    def _expired(self, updated_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - updated_at > self.ttl_seconds
+
+    def _drop(self, session_id: str):
+        entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def _keep(self, session_id: str, data: bytes, updated_at: float, mtime_ns: int = None):
+        self._drop(session_id)
+        self._sessions[session_id] = (data, updated_at, mtime_ns)
+        self._bytes += len(data)
+
+    def _load(self, session_id: str):
+        """(data, updated_at) of a session, refreshed from its file when another worker changed it"""
+        if self.directory is None:
+            with self._lock:
+                entry = self._sessions.get(session_id)
+            return entry[:2] if entry else None
+
+        path = self.directory / session_id
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            with self._lock:
+                self._drop(session_id)
+            return None
+
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None and entry[2] == stat.st_mtime_ns:
+                return entry[:2]
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._keep(session_id, data, stat.st_mtime, stat.st_mtime_ns)
+            self._stats["disk_reads"] += 1
+        return data, stat.st_mtime
+
+    def _write(self, session_id: str, data: bytes) -> int:
+        """Replace a session's file atomically; returns its new mtime_ns"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / session_id
+        tmp_path = self.directory / f".{session_id}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path.stat().st_mtime_ns
+
+    def _remove(self, session_id: str):
+        if self.directory is not None:
+            try:
+                (self.directory / session_id).unlink()
+            except FileNotFoundError:
+                pass
+
+    def history(self, session_id: str) -> list:
+        """Turns of a live session, oldest first ([] for unknown or expired sessions)"""
+        if not self.enabled:
+            return []
+
+        entry = self._load(session_id)
+        if entry is None:
+            return []
+        data, updated_at = entry
+        if self._expired(updated_at, time.time()):
+            with self._lock:
+                self._drop(session_id)
+                self._stats["expirations"] += 1
+            self._remove(session_id)
+            return []
+        with self._lock:
+            if session_id in self._sessions:
+                self._sessions.move_to_end(session_id)
+        return json.loads(zlib.decompress(data))
+
+    def record(self, session_id: str, question: str, query: str, answer: str):
+        """Append a turn, keeping the last max_turns"""
+        if not self.enabled:
+            return
+
+        turn = {"question": question, "query": query, "answer": compress_answer(answer, self.answer_chars)}
+        now = time.time()
+
+        # Two workers recording a turn for the same session at once keep only one of them
+        turns = []
+        entry = self._load(session_id)
+        if entry is not None and not self._expired(entry[1], now):
+            turns = json.loads(zlib.decompress(entry[0]))
+        turns.append(turn)
+        data = zlib.compress(json.dumps(turns[-self.max_turns:]).encode('utf-8'))
+        mtime_ns = self._write(session_id, data) if self.directory is not None else None
+
+        evicted = []
+        with self._lock:
+            self._keep(session_id, data, now, mtime_ns)
+            self._stats["turns_recorded"] += 1
+            prune = self.directory is not None and self._stats["turns_recorded"] % SESSION_PRUNE_EVERY == 0
+
+            while self._sessions:
+                oldest_id, (_, updated_at, _) = next(iter(self._sessions.items()))
+                if self._expired(updated_at, now):
+                    self._stats["expirations"] += 1
+                    evicted.append(oldest_id)
+                elif len(self._sessions) > self.max_sessions:
+                    self._stats["evictions"] += 1
+                else:
+                    break
+                self._drop(oldest_id)
+
+        for expired_id in evicted:
+            self._remove(expired_id)
+        if prune:
+            self._prune_directory(now)
+
+    def _prune_directory(self, now: float):
+        """Delete expired session files, then the oldest beyond max_sessions"""
+        files = []
+        for path in self.directory.iterdir():
+            if path.name.startswith("."):
+                continue  # another worker's write in progress
+            try:
+                files.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        files.sort()
+        for position, (mtime, path) in enumerate(files):
+            if self._expired(mtime, now) or len(files) - position > self.max_sessions:
+                path.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "enabled": self.enabled,
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "bytes": self._bytes,
+                "shared": self.directory is not None
+            }
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+RABuddy Stub LLM
+Offline stand-in for gemini_model with configurable latency and token rate, used by the benchmarks
+"""
+
+import re
+import time
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StubGenerativeModel:
+    """Mimics GenerativeModel.generate_content (blocking and stream=True)
+
+    The first token arrives after first_token_latency seconds and the rest at
+    tokens_per_second; the answer cites the sources present in the prompt.
+    """
+
+    def __init__(self, first_token_latency: float = 0.6, tokens_per_second: float = 80.0,
+                 answer_tokens: int = 120):
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.calls = 0
+
+    def _answer_tokens(self, prompt: str) -> list:
+        sources = sorted(set(re.findall(r"\[Source (\d+)\]", prompt)), key=int) or ["1"]
+        words = []
+        for i in range(self.answer_tokens):
+            words.append("policy" if i % 12 else f"(Source {sources[(i // 12) % len(sources)]})")
+        return [word + " " for word in words]
+
+    def _stream(self, tokens: list):
+        time.sleep(self.first_token_latency)
+        delay = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        for token in tokens:
+            yield StubResponse(token)
+            if delay:
+                time.sleep(delay)
+
+    def generate_content(self, prompt: str, stream: bool = False, request_options=None, **kwargs):
+        self.calls += 1
+        tokens = self._answer_tokens(prompt)
+        if stream:
+            return self._stream(tokens)
+
+        generation_seconds = len(tokens) / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        time.sleep(self.first_token_latency + generation_seconds)
+        return StubResponse("".join(tokens).strip())
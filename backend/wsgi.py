@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+RABuddy Production WSGI Entry Point
+Imported once by the gunicorn master (preload_app): starts the index build, preloads models, then workers fork
+"""
+
+import logging
+import multiprocessing
+import time
+
+import enhanced_app
+
+logger = logging.getLogger(__name__)
+
+_spawn = multiprocessing.get_context("spawn")
+
+# Shared with the leader process and inherited by forked workers
+index_status = _spawn.Value('i', -1)  # -1 building, 0 ready, 1 failed
+index_done = _spawn.Event()
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # peak, in KB on Linux
+
+
+def wait_for_index() -> bool:
+    """Block a worker's warm-up until the leader finished building the index"""
+    index_done.wait()
+    return index_status.value == 0
+
+
+def prepare_leader():
+    """Start the one-and-only index build, then preload models before fork"""
+    # A separate process keeps model inference (and its thread pools) out of the master.
+    # It runs while workers fork and bind; their readiness waits for it.
+    builder = _spawn.Process(
+        target=enhanced_app.build_index_once,
+        args=(index_status, index_done),
+        name="rabuddy-index-builder"
+    )
+    builder.start()
+
+    # Load model weights before fork so workers share the pages copy-on-write
+    preload_started = time.perf_counter()
+    if not enhanced_app.setup_enhanced_embedding():
+        raise RuntimeError("Embedding model preload failed")
+
+    logger.info(f"🏁 Leader ready: model preload {time.perf_counter() - preload_started:.1f}s, RSS {current_rss_mb():.0f} MB, index building in pid {builder.pid}")
+
+
+prepare_leader()
+
+app = enhanced_app.app
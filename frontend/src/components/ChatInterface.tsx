@@ -28,6 +28,7 @@ export default function ChatInterface() {
   const [input, setInput] = useState('')
   const [loading, setLoading] = useState(false)
   const [feedback, setFeedback] = useState<FeedbackState>({})
+  const [sessionId, setSessionId] = useState<string | null>(null)
 
   // Function to render content with highlighted inline citations and proper list formatting
   const renderContentWithCitations = (content: string, sources: Source[] = []) => {
@@ -150,43 +151,88 @@ export default function ChatInterface() {
       const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'https://107bc118b418.ngrok-free.app'
       console.log('API URL:', apiUrl)
       console.log('Environment variable:', process.env.NEXT_PUBLIC_API_URL)
-      console.log('Sending request to:', `${apiUrl}/api/query`)
+      console.log('Sending request to:', `${apiUrl}/api/query/stream`)
       console.log('Request body:', { question: userMessage.content })
       
       const controller = new AbortController()
       const timeoutId = setTimeout(() => controller.abort(), 60000) // 60 second timeout
       
-      const response = await fetch(`${apiUrl}/api/query`, {
+      // Stream the answer: sources arrive first, then answer tokens as they are generated
+      const response = await fetch(`${apiUrl}/api/query/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'Accept': 'text/event-stream',
           'ngrok-skip-browser-warning': 'true',
         },
-        body: JSON.stringify({ question: userMessage.content }),
+        body: JSON.stringify({ question: userMessage.content, session_id: sessionId }),
         signal: controller.signal,
       })
-      
-      clearTimeout(timeoutId)
 
       console.log('Response status:', response.status)
       console.log('Response ok:', response.ok)
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
+        clearTimeout(timeoutId)
         throw new Error('Failed to get response')
       }
 
-      const data = await response.json()
-      console.log('Response data:', data)
+      let messageId = `${Date.now()}-assistant`
+      const updateAssistant = (update: (message: Message) => Message) => {
+        const targetId = messageId // capture now, the updater runs later
+        setMessages(prev => prev.map(m => (m.id === targetId ? update(m) : m)))
+      }
 
-      const assistantMessage: Message = {
-        id: data.session_id || data.query_id || Date.now().toString(),
+      setMessages(prev => [...prev, {
+        id: messageId,
         type: 'assistant',
-        content: data.answer,
-        sources: data.sources || [],
+        content: '',
+        sources: [],
         timestamp: new Date()
-      }
+      }])
+
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+
+      try {
+        while (true) {
+          const { done, value } = await reader.read()
+          if (done) break
 
-      setMessages(prev => [...prev, assistantMessage])
+          buffer += decoder.decode(value, { stream: true })
+          const rawEvents = buffer.split('\n\n')
+          buffer = rawEvents.pop() || ''
+
+          for (const rawEvent of rawEvents) {
+            let event = 'message'
+            let payload = ''
+            for (const line of rawEvent.split('\n')) {
+              if (line.startsWith('event:')) event = line.slice(6).trim()
+              else if (line.startsWith('data:')) payload += line.slice(5).trim()
+            }
+            if (!payload) continue
+
+            const data = JSON.parse(payload)
+            if (event === 'sources') {
+              if (data.session_id) setSessionId(data.session_id)
+              const newId = data.query_id || data.session_id || messageId
+              updateAssistant(m => ({ ...m, id: newId, sources: data.sources || [] }))
+              messageId = newId
+            } else if (event === 'token') {
+              updateAssistant(m => ({ ...m, content: m.content + data.text }))
+            } else if (event === 'error') {
+              console.error('Streaming error:', data.error)
+              updateAssistant(m => ({
+                ...m,
+                content: m.content || data.answer || 'Sorry, I encountered an error. Please try again.'
+              }))
+            }
+          }
+        }
+      } finally {
+        clearTimeout(timeoutId)
+      }
     } catch (error) {
       console.error('Error sending message:', error)
       let errorContent = 'Sorry, I encountered an error. Please try again.'
@@ -8,11 +8,24 @@ if [ -f backend/.env ]; then
     export $(grep -v '^#' backend/.env | xargs)
 fi
 
-# Install dependencies
-echo "📦 Installing dependencies..."
-pip install -r backend/requirements.txt
+# Install dependencies (opt-in, so restarts don't wait on pip)
+if [ "$INSTALL_DEPS" = "1" ]; then
+    echo "📦 Installing dependencies..."
+    if [ "$EMBEDDING_BACKEND" = "onnx" ]; then
+        pip install -r backend/requirements-onnx.txt  # no torch / sentence-transformers
+    else
+        pip install -r backend/requirements.txt
+    fi
+fi
 
-# Start the Flask backend
-echo "🔧 Starting Flask backend on port 5001..."
 cd backend
-python app.py
+
+if [ "$1" = "--dev" ]; then
+    # Single-process Flask dev server with auto-reload
+    echo "🔧 Starting Flask dev server on port ${PORT:-5001}..."
+    python app.py
+else
+    # Production: index built once, models preloaded, then workers fork
+    echo "🔧 Starting gunicorn on port ${PORT:-5001} with ${WEB_CONCURRENCY:-2} workers..."
+    exec gunicorn -c gunicorn.conf.py wsgi:app
+fi